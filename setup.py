@@ -25,6 +25,8 @@ setup(
         "console_scripts": [
             "edge-gpt = EdgeGPT:main",
             "edge-gpt-image = ImageGen:main",
+            "edge-gpt-mock = MockServer:main",
+            "edge-gpt-serve = ChatServer:main",
         ],
     },
     install_requires=[
@@ -36,9 +38,12 @@ setup(
         "requests",
         "BingImageCreator>=0.1.2.1",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     long_description=open(PATH, encoding="utf-8").read(),
     long_description_content_type="text/markdown",
-    py_modules=["EdgeGPT", "ImageGen"],
+    py_modules=["EdgeGPT", "ImageGen", "MockServer", "ChatServer", "LocalHTTP"],
     classifiers=[
         "License :: OSI Approved :: The Unlicense (Unlicense)",
         "Intended Audience :: Developers",
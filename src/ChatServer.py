@@ -0,0 +1,604 @@
+"""
+OpenAI-compatible HTTP front end for EdgeGPT. Conversations are kept open
+between requests and share one HTTP client, conversation pool and set of
+accounts.
+
+    edge-gpt-serve --cookie-file cookies.json --port 8000
+    curl http://127.0.0.1:8000/v1/chat/completions -d \
+        '{"model": "creative", "stream": true, "messages": [{"role": "user", "content": "Hi"}]}'
+
+Pass the conversation_id of a response (also sent as the X-Conversation-Id
+header) with the next request to continue the same Bing conversation.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+import httpx
+from EdgeGPT import COOKIE_STORE
+from EdgeGPT import METRICS
+from EdgeGPT import AccountScheduler
+from EdgeGPT import Chatbot
+from EdgeGPT import ContextWindow
+from EdgeGPT import CircuitOpenError
+from EdgeGPT import ConversationPool
+from EdgeGPT import FatalError
+from EdgeGPT import NoAccountAvailable
+from EdgeGPT import RetryableError
+from EdgeGPT import StandbyConnections
+from EdgeGPT import _response_text
+from EdgeGPT import create_session
+from LocalHTTP import BadRequest
+from LocalHTTP import read_request
+from LocalHTTP import write_response
+
+# Model names map to Bing conversation styles
+MODELS = ["creative", "balanced", "precise"]
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str, kind: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status: int = status
+        self.kind: str = kind
+
+
+def _upstream_error(exc: Exception) -> _HTTPError:
+    """
+    Maps EdgeGPT errors to the status a client should see
+    """
+    if isinstance(exc, (NoAccountAvailable, CircuitOpenError)):
+        return _HTTPError(503, str(exc), "server_error")
+    if isinstance(exc, (RetryableError, FatalError)):
+        return _HTTPError(502, str(exc), "upstream_error")
+    return _HTTPError(500, str(exc), "server_error")
+
+
+def _result_error(response: dict) -> _HTTPError | None:
+    """
+    Returns the error for a final response that Bing did not answer
+    """
+    result = response.get("item", {}).get("result", {})
+    value = result.get("value", "Success")
+    if value == "Success":
+        return None
+    message = result.get("message") or value
+    if value == "Throttled":
+        return _HTTPError(429, message, "rate_limit_error")
+    return _HTTPError(502, message, "upstream_error")
+
+
+def _webpage_context(messages: list[dict]) -> str | None:
+    """
+    Renders earlier messages of a new conversation in Bing's own format
+    """
+    if not messages:
+        return None
+    return "\n\n".join(
+        f"[{message.get('role', 'user')}](#message)\n{message.get('content', '')}"
+        for message in messages
+    )
+
+
+class _Session:
+    """
+    One Bing conversation exposed through the server
+    """
+
+    def __init__(self, bot: Chatbot) -> None:
+        self.bot: Chatbot = bot
+        # Turns of one conversation must not overlap
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.last_used: float = time.monotonic()
+
+
+class ChatServer:
+    """
+    Serves /v1/chat/completions with optional server-sent-event streaming,
+    /v1/models and /metrics
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        cookies: list[dict] | None = None,
+        scheduler: AccountScheduler | None = None,
+        proxy: str | None = None,
+        wss_link: str = "wss://sydney.bing.com/sydney/ChatHub",
+        pool_size: int = 4,
+        standby: int = 2,
+        max_conversations: int = 1000,
+        conversation_ttl: float = 1800,
+        concurrency: int = 256,
+        api_key: str | None = None,
+        context_budget: int = 32768,
+    ) -> None:
+        if cookies is None and scheduler is None:
+            raise ValueError("Either cookies or scheduler is required")
+        self.host: str = host
+        self.port: int = port
+        self.cookies: list[dict] | None = cookies
+        self.scheduler: AccountScheduler | None = scheduler
+        self.proxy: str | None = proxy
+        self.wss_link: str = wss_link
+        self.pool_size: int = pool_size
+        self.standby_size: int = standby
+        self.max_conversations: int = max_conversations
+        # Conversations idle for longer are closed
+        self.conversation_ttl: float = conversation_ttl
+        # Turns in flight upstream at once, further requests wait
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.api_key: str | None = api_key
+        # Bytes of earlier messages sent along with a new conversation
+        self.context_budget: int = context_budget
+        self.sessions: OrderedDict[str, _Session] = OrderedDict()
+        self.server: asyncio.AbstractServer | None = None
+        self.session: httpx.AsyncClient | None = None
+        self.pool: ConversationPool | None = None
+        self.standby: StandbyConnections | None = None
+
+    async def start(self) -> None:
+        self.session = create_session(self.proxy)
+        self.pool = ConversationPool(size=self.pool_size, session=self.session)
+        if self.standby_size:
+            self.standby = StandbyConnections(size=self.standby_size)
+        self.server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+        )
+        if not self.port:
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for session in self.sessions.values():
+            await session.bot.close()
+        self.sessions.clear()
+        if self.standby is not None:
+            await self.standby.close()
+        if self.pool is not None:
+            await self.pool.close()
+        if self.session is not None:
+            await self.session.aclose()
+
+    async def __aenter__(self) -> ChatServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _new_session(self) -> tuple[str, _Session]:
+        conversation_id = uuid.uuid4().hex
+        session = _Session(
+            Chatbot(
+                cookies=self.cookies,
+                proxy=self.proxy,
+                keep_alive=True,
+                session=self.session,
+                pool=self.pool,
+                scheduler=self.scheduler,
+                standby=self.standby,
+            ),
+        )
+        self.sessions[conversation_id] = session
+        return conversation_id, session
+
+    async def _evict(self) -> None:
+        """
+        Close conversations that are idle for too long or over the limit
+        """
+        now = time.monotonic()
+        # Oldest first; conversations in the middle of a turn are skipped
+        for conversation_id, session in list(self.sessions.items()):
+            if (
+                len(self.sessions) < self.max_conversations
+                and now - session.last_used < self.conversation_ttl
+            ):
+                break
+            if session.lock.locked():
+                continue
+            if self.sessions.get(conversation_id) is not session:
+                continue
+            del self.sessions[conversation_id]
+            await session.bot.close()
+
+    async def _drop(self, conversation_id: str) -> None:
+        session = self.sessions.pop(conversation_id, None)
+        if session is not None:
+            await session.bot.close()
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as exc:
+                    # The stream is out of sync, answer and give up on it
+                    await self._send_error(writer, _HTTPError(400, str(exc)))
+                    return
+                if request is None:
+                    return
+                method, headers = request.method, request.headers
+                path = request.path.rstrip("/")
+                try:
+                    keep_open = await self._route(
+                        method,
+                        path,
+                        headers,
+                        request.body,
+                        writer,
+                    )
+                except _HTTPError as exc:
+                    await self._send_error(writer, exc)
+                    keep_open = True
+                if not keep_open or headers.get("connection", "").lower() == "close":
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _route(
+        self,
+        method: str,
+        path: str,
+        headers: dict,
+        body: bytes,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        """
+        Handles one request, returns False if the connection must be closed
+        """
+        if method == "GET" and path == "/metrics":
+            await self._send(
+                writer,
+                200,
+                METRICS.prometheus().encode(),
+                "text/plain; version=0.0.4",
+            )
+            return True
+        if method == "GET" and path == "/health":
+            await self._send_json(
+                writer,
+                200,
+                {"status": "ok", "conversations": len(self.sessions)},
+            )
+            return True
+        if self.api_key is not None and (
+            headers.get("authorization") != f"Bearer {self.api_key}"
+        ):
+            raise _HTTPError(401, "Invalid API key", "authentication_error")
+        if method == "GET" and path == "/v1/models":
+            await self._send_json(
+                writer,
+                200,
+                {
+                    "object": "list",
+                    "data": [
+                        {"id": model, "object": "model", "owned_by": "bing"}
+                        for model in MODELS
+                    ],
+                },
+            )
+            return True
+        if method == "POST" and path == "/v1/chat/completions":
+            return await self._chat_completions(headers, body, writer)
+        raise _HTTPError(404, f"No route for {method} {path}")
+
+    async def _chat_completions(
+        self,
+        headers: dict,
+        body: bytes,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError as exc:
+            raise _HTTPError(400, "Request body is not valid JSON") from exc
+        if not isinstance(request, dict):
+            raise _HTTPError(400, "Request body must be a JSON object")
+        messages = request.get("messages")
+        if not isinstance(messages, list) or not all(
+            isinstance(message, dict) and isinstance(message.get("content", ""), str)
+            for message in messages
+        ):
+            raise _HTTPError(
+                400,
+                "messages must be a list of objects with string content",
+            )
+        if not messages or messages[-1].get("role") != "user":
+            raise _HTTPError(400, "The last message must come from the user")
+        model = request.get("model") or "balanced"
+        if model not in MODELS:
+            raise _HTTPError(404, f"Unknown model {model}, use one of {MODELS}")
+        conversation_id = headers.get("x-conversation-id") or request.get(
+            "conversation_id",
+        )
+        webpage_context = None
+        if conversation_id:
+            session = self.sessions.get(conversation_id)
+            if session is None:
+                raise _HTTPError(404, f"Unknown conversation {conversation_id}")
+        else:
+            await self._evict()
+            conversation_id, session = self._new_session()
+            webpage_context = _webpage_context(messages[:-1])
+            if webpage_context is not None:
+                webpage_context = ContextWindow(self.context_budget).update(
+                    webpage_context,
+                )
+        self.sessions.move_to_end(conversation_id)
+        turn = {
+            "prompt": messages[-1].get("content", ""),
+            "wss_link": self.wss_link,
+            "conversation_style": model,
+            "webpage_context": webpage_context,
+        }
+        async with session.lock, self.semaphore:
+            session.last_used = time.monotonic()
+            if request.get("stream"):
+                return await self._stream(conversation_id, session, model, turn, writer)
+            try:
+                response = await session.bot.ask(**turn)
+            except Exception as exc:
+                await self._drop(conversation_id)
+                raise _upstream_error(exc) from exc
+        error = _result_error(response)
+        if error is not None:
+            raise error
+        await self._send_json(
+            writer,
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "conversation_id": conversation_id,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": _response_text(response),
+                        },
+                        "finish_reason": "stop",
+                    },
+                ],
+            },
+            {"X-Conversation-Id": conversation_id},
+        )
+        return True
+
+    async def _stream(
+        self,
+        conversation_id: str,
+        session: _Session,
+        model: str,
+        turn: dict,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        """
+        Streams one turn as chat.completion.chunk events. The connection is
+        closed afterwards since the body has no length.
+        """
+        chunk = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "conversation_id": conversation_id,
+        }
+
+        async def send(data: dict | str) -> None:
+            if not isinstance(data, str):
+                data = json.dumps(data, ensure_ascii=False)
+            writer.write(f"data: {data}\n\n".encode())
+            await writer.drain()
+
+        def choice(delta: dict, finish_reason: str | None = None) -> dict:
+            return {
+                **chunk,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason},
+                ],
+            }
+
+        writer.write(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/event-stream\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Connection: close\r\n"
+            f"X-Conversation-Id: {conversation_id}\r\n"
+            "\r\n".encode(),
+        )
+        try:
+            await send(choice({"role": "assistant"}))
+            finish_reason = "stop"
+            async for final, response in session.bot.ask_stream(
+                **turn,
+                delta=True,
+            ):
+                if final:
+                    error = _result_error(response)
+                    if error is not None:
+                        await send({"error": {"message": str(error), "type": error.kind}})
+                        return False
+                elif response.revoked:
+                    # Text already sent cannot be taken back
+                    finish_reason = "content_filter"
+                elif response.text and finish_reason == "stop":
+                    await send(choice({"content": response.text}))
+            await send(choice({}, finish_reason))
+            await send("[DONE]")
+        except ConnectionError:
+            # The client went away mid-turn, the socket is in an unknown state
+            await self._drop(conversation_id)
+        except Exception as exc:
+            await self._drop(conversation_id)
+            error = _upstream_error(exc)
+            with contextlib.suppress(ConnectionError):
+                await send({"error": {"message": str(error), "type": error.kind}})
+        return False
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        data: bytes,
+        content_type: str,
+        headers: dict | None = None,
+    ) -> None:
+        write_response(writer, status, data, content_type, headers)
+        await writer.drain()
+
+    async def _send_json(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: dict,
+        headers: dict | None = None,
+    ) -> None:
+        await self._send(
+            writer,
+            status,
+            json.dumps(payload, ensure_ascii=False).encode(),
+            "application/json",
+            headers,
+        )
+
+    async def _send_error(self, writer: asyncio.StreamWriter, exc: _HTTPError) -> None:
+        await self._send_json(
+            writer,
+            exc.status,
+            {"error": {"message": str(exc), "type": exc.kind}},
+        )
+
+
+async def async_main(args: argparse.Namespace) -> None:
+    server = ChatServer(
+        host=args.host,
+        port=args.port,
+        cookies=args.cookies,
+        scheduler=args.scheduler,
+        proxy=args.proxy,
+        wss_link=args.wss_link,
+        pool_size=args.pool_size,
+        standby=args.standby,
+        max_conversations=args.max_conversations,
+        conversation_ttl=args.conversation_ttl,
+        concurrency=args.concurrency,
+        api_key=args.api_key,
+        context_budget=args.context_budget,
+    )
+    async with server:
+        print(f"Serving on {server.url}")
+        await server.server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--cookie-file",
+        type=str,
+        default=os.environ.get("COOKIE_FILE", ""),
+        help="Cookie file used for authentication (defaults to COOKIE_FILE environment variable)",
+    )
+    parser.add_argument(
+        "--cookie-dir",
+        type=str,
+        default=None,
+        help="Directory of cookie files, one per account, to rotate between",
+    )
+    parser.add_argument(
+        "--proxy",
+        help="Proxy URL (e.g. socks5://127.0.0.1:1080)",
+        type=str,
+    )
+    parser.add_argument(
+        "--wss-link",
+        help="WSS URL(e.g. wss://sydney.bing.com/sydney/ChatHub)",
+        type=str,
+        default="wss://sydney.bing.com/sydney/ChatHub",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=4,
+        help="Conversations kept ready per account",
+    )
+    parser.add_argument(
+        "--standby",
+        type=int,
+        default=2,
+        help="Websockets kept open ahead of demand",
+    )
+    parser.add_argument("--max-conversations", type=int, default=1000)
+    parser.add_argument(
+        "--conversation-ttl",
+        type=float,
+        default=1800,
+        help="Seconds before an idle conversation is closed",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=256,
+        help="Turns in flight upstream at once",
+    )
+    parser.add_argument(
+        "--api-key",
+        type=str,
+        default=os.environ.get("EDGEGPT_API_KEY"),
+        help="Bearer token clients must send (defaults to EDGEGPT_API_KEY environment variable)",
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=32768,
+        help="Bytes of earlier messages sent when a conversation starts",
+    )
+    args = parser.parse_args()
+    args.cookies = None
+    args.scheduler = None
+    if args.cookie_dir:
+        args.scheduler = AccountScheduler(cookie_dir=args.cookie_dir)
+    elif args.cookie_file:
+        args.cookies = COOKIE_STORE.load(args.cookie_file)
+    else:
+        parser.print_help()
+        parser.exit(
+            1,
+            "ERROR: use --cookie-file, --cookie-dir or set the COOKIE_FILE environment variable",
+        )
+    try:
+        asyncio.run(async_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
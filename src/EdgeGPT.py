@@ -5,19 +5,34 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import bisect
+import contextlib
+import functools
+import hashlib
+import http.cookiejar
 import json
 import os
 import random
 import re
+import socket
+import sqlite3
 import ssl
 import sys
+import time
 import uuid
+from collections import OrderedDict
+from collections import deque
 from enum import Enum
 from pathlib import Path
+from typing import AsyncGenerator
+from typing import Callable
 from typing import Generator
+from typing import Iterable
 from typing import Literal
+from typing import NamedTuple
 from typing import Optional
 from typing import Union
+from urllib.parse import urlsplit
 
 import certifi
 import httpx
@@ -30,6 +45,15 @@ from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.key_binding import KeyBindings
 from rich.live import Live
 from rich.markdown import Markdown
+from websockets.exceptions import ConnectionClosed
+from websockets.exceptions import InvalidHandshake
+from websockets.exceptions import InvalidStatusCode
+from websockets.uri import parse_uri
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DELIMITER = "\x1e"
 
@@ -86,14 +110,490 @@ HEADERS_INIT_CONVER = {
     "x-forwarded-for": FORWARDED_IP,
 }
 
-ssl_context = ssl.create_default_context()
+
+
+class _TLSContext(ssl.SSLContext):
+    """
+    Client context that resumes the last TLS session of each host, so new
+    websocket and REST connections skip the full handshake
+    """
+
+    def __init__(self, protocol: int) -> None:
+        self.sessions: dict[str, ssl.SSLSession] = {}
+        # Newest connection per host; its session may arrive after the handshake
+        self.latest: dict[str, ssl.SSLObject] = {}
+
+    def _session(self, server_hostname: str | None) -> ssl.SSLSession | None:
+        latest = self.latest.get(server_hostname)
+        if latest is not None and latest.session is not None:
+            self.sessions[server_hostname] = latest.session
+        return self.sessions.get(server_hostname)
+
+    def wrap_bio(
+        self,
+        incoming: ssl.MemoryBIO,
+        outgoing: ssl.MemoryBIO,
+        server_side: bool = False,
+        server_hostname: str | None = None,
+        session: ssl.SSLSession | None = None,
+    ) -> ssl.SSLObject:
+        if server_side or server_hostname is None:
+            return super().wrap_bio(
+                incoming,
+                outgoing,
+                server_side,
+                server_hostname,
+                session,
+            )
+        # anyio passes the host name as bytes
+        host = (
+            server_hostname.decode()
+            if isinstance(server_hostname, bytes)
+            else server_hostname
+        )
+        if session is None:
+            session = self._session(host)
+        ssl_object = super().wrap_bio(
+            incoming,
+            outgoing,
+            server_side,
+            server_hostname,
+            session,
+        )
+        self.latest[host] = ssl_object
+        return ssl_object
+
+
+# Shared by websockets and httpx so both resume the same TLS sessions
+ssl_context = _TLSContext(ssl.PROTOCOL_TLS_CLIENT)
+ssl_context.load_default_certs()
 ssl_context.load_verify_locations(certifi.where())
 
+DNS_TTL = 300
+
+
+class DNSCache:
+    """
+    Caches resolved upstream addresses for ttl seconds
+    """
+
+    def __init__(self, ttl: float = DNS_TTL) -> None:
+        self.ttl: float = ttl
+        self.entries: dict[tuple[str, int], tuple[float, list[str]]] = {}
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        entry = self.entries.get((host, port))
+        if entry is not None and time.monotonic() < entry[0]:
+            return entry[1]
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host,
+            port,
+            type=socket.SOCK_STREAM,
+        )
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def prefer(self, host: str, port: int, address: str) -> None:
+        """
+        Moves an address that could be reached to the front of its entry
+        """
+        entry = self.entries.get((host, port))
+        if entry is not None and address in entry[1]:
+            addresses = [address] + [other for other in entry[1] if other != address]
+            self.entries[(host, port)] = (entry[0], addresses)
+
+    def invalidate(self, host: str, port: int) -> None:
+        self.entries.pop((host, port), None)
+
+
+DNS_CACHE = DNSCache()
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=30,
+)
+
+
+def _get_proxy(proxy: str | None = None) -> str | None:
+    """
+    Resolves the proxy to use, falling back to the environment
+    """
+    proxy = (
+        proxy
+        or os.environ.get("all_proxy")
+        or os.environ.get("ALL_PROXY")
+        or os.environ.get("https_proxy")
+        or os.environ.get("HTTPS_PROXY")
+        or None
+    )
+    if proxy is not None and proxy.startswith("socks5h://"):
+        proxy = "socks5://" + proxy[len("socks5h://") :]
+    return proxy
+
+
+def _update_conversation_url(wss_link: str) -> str:
+    """
+    Derives the UpdateConversation endpoint from the ChatHub websocket URL
+    """
+    url = httpx.URL(wss_link)
+    return str(
+        url.copy_with(
+            scheme="https" if url.scheme == "wss" else "http",
+            path=url.path.rsplit("/", 1)[0] + "/UpdateConversation/",
+        ),
+    )
+
+
+def _cookie_header(cookies: list[dict]) -> str:
+    if isinstance(cookies, Cookies):
+        return cookies.header
+    return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+
 
-class NotAllowedToAccess(Exception):
+def _cookie_value(cookies: list[dict], name: str) -> str | None:
+    if isinstance(cookies, Cookies):
+        return cookies.value(name)
+    for cookie in cookies:
+        if cookie["name"] == name:
+            return cookie["value"]
+    return None
+
+
+class Cookies(list):
+    """
+    Cookie list as exported by browser extensions, indexed by name. Treat
+    it as read-only, it is shared between bots.
+    """
+
+    def __init__(self, cookies: Iterable[dict] = ()) -> None:
+        super().__init__(cookies)
+        self.by_name: dict[str, dict] = {cookie["name"]: cookie for cookie in self}
+
+    def value(self, name: str) -> str | None:
+        cookie = self.by_name.get(name)
+        return None if cookie is None else cookie["value"]
+
+    @functools.cached_property
+    def header(self) -> str:
+        return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in self)
+
+
+class CookieStore:
+    """
+    Parses each cookie file once per process and again only after its
+    mtime changes, so every bot using a file shares one Cookies object
+    """
+
+    def __init__(self, required: Iterable[str] = ("_U",)) -> None:
+        self.required: tuple[str, ...] = tuple(required)
+        self.files: dict[str, tuple[int, Cookies]] = {}
+
+    def load(self, path: str | Path) -> Cookies:
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError as exc:
+            raise FileNotFoundError("Cookie file not found") from exc
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            cookies = self.validate(json.load(f), path)
+        self.files[path] = (mtime, cookies)
+        return cookies
+
+    def validate(self, cookies: list[dict], source: str = "cookies") -> Cookies:
+        """
+        Checks the structure and the required entries of a cookie list
+        """
+        if not isinstance(cookies, list) or not all(
+            isinstance(cookie, dict) and "name" in cookie and "value" in cookie
+            for cookie in cookies
+        ):
+            raise ValueError(f"{source} is not a list of cookies with name and value")
+        cookies = cookies if isinstance(cookies, Cookies) else Cookies(cookies)
+        missing = [name for name in self.required if name not in cookies.by_name]
+        if missing:
+            raise ValueError(f"{source} is missing the {', '.join(missing)} cookie")
+        return cookies
+
+
+COOKIE_STORE = CookieStore()
+
+
+def create_session(proxy: str | None = None) -> httpx.AsyncClient:
+    """
+    Creates a pooled HTTP client for the REST calls of one or more chatbots.
+    Cookies are sent per request and never stored, so the client can be
+    shared between accounts.
+    """
+    return httpx.AsyncClient(
+        proxies=_get_proxy(proxy),
+        verify=ssl_context,
+        timeout=30,
+        limits=HTTP_LIMITS,
+        cookies=http.cookiejar.CookieJar(
+            policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]),
+        ),
+    )
+
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * len(buckets)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile from the bucket counts
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Registry for phase timings and counters. Hooks are called with the
+    metric name and the observed value (seconds, or a counter increment).
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+        self.hooks: list[Callable[[str, float], None]] = []
+
+    def add_hook(self, hook: Callable[[str, float], None]) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, float], None]) -> None:
+        self.hooks.remove(hook)
+
+    def observe(self, name: str, value: float) -> None:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(self.buckets)
+        self.histograms[name].observe(value)
+        for hook in self.hooks:
+            hook(name, value)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook(name, value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def prometheus(self, prefix: str = "edgegpt_") -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, value in sorted(self.counters.items()):
+            metric = f"{prefix}{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Default registry used by chatbots that are not given their own
+METRICS = Metrics()
+
+
+class RetryableError(Exception):
+    """
+    Transient failure, such as a network error or an overloaded server
+    """
+
+
+class FatalError(Exception):
+    """
+    Failure that retrying will not fix, such as rejected credentials
+    """
+
+
+class NotAllowedToAccess(FatalError):
     pass
 
 
+class CircuitOpenError(Exception):
+    """
+    Raised without contacting a backend that is known to be down
+    """
+
+
+class StreamTimeout(RetryableError):
+    """
+    A turn ran past its deadline or the stream stalled
+    """
+
+
+def _check_status(response: httpx.Response, message: str) -> None:
+    """
+    Raises the error class matching a failed response
+    """
+    if response.status_code == 200:
+        return
+    error = f"{message} (status {response.status_code}, {response.url}): {response.text[:200]}"
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(error)
+    raise FatalError(error)
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated failures of one endpoint or account and lets
+    a single trial request through once reset_timeout has passed
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.opened_at: float | None = None
+        self.trial: bool = False
+
+    @property
+    def available(self) -> bool:
+        return (
+            self.opened_at is None
+            or time.monotonic() - self.opened_at >= self.reset_timeout
+        )
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.available or self.trial:
+            return False
+        self.trial = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+BREAKERS: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(key: str) -> CircuitBreaker:
+    """
+    Returns the process-wide breaker for an endpoint or account
+    """
+    if key not in BREAKERS:
+        BREAKERS[key] = CircuitBreaker()
+    return BREAKERS[key]
+
+
+class RetryPolicy:
+    """
+    Retries RetryableError with jittered exponential backoff
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8,
+    ) -> None:
+        self.attempts: int = attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def run(self, func: Callable, *args, breaker: CircuitBreaker | None = None):
+        """
+        Awaits func(*args), recording the outcome on breaker
+        """
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("Backend is marked as down")
+            try:
+                result = await func(*args)
+            except RetryableError:
+                if breaker is not None:
+                    breaker.record_failure()
+                if attempt == self.attempts - 1:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+            except BaseException:
+                # Not the backend's fault, just give the trial back
+                if breaker is not None:
+                    breaker.trial = False
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
+
+# Used for REST calls and websocket connects unless another policy is passed
+RETRY_POLICY = RetryPolicy()
+
+
 class ConversationStyle(Enum):
     creative = [
         "nlu_direct_response_filter",
@@ -152,20 +652,176 @@ CONVERSATION_STYLE_TYPE = Optional[
     Union[ConversationStyle, Literal["creative", "balanced", "precise"]]
 ]
 
+# What a full update buffer does with a new update: merge it into the last
+# queued one, wait for the consumer, or keep only the newest state
+OVERFLOW_POLICY_TYPE = Literal["coalesce", "block", "latest"]
+
+
+class StreamDelta(NamedTuple):
+    """
+    Text added to the response since the previous update. If revoked is set,
+    everything from offset onwards was replaced and text is the new content.
+    """
+
+    text: str
+    offset: int
+    revoked: bool = False
+
+
+class GeneratedImage(NamedTuple):
+    """
+    An image drawn for a response and, if it was downloaded, its file
+    """
+
+    url: str
+    path: str | None = None
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of one prompt of Chatbot.ask_many
+    """
+
+    index: int
+    prompt: str
+    response: dict | None
+    error: Exception | None = None
+
+
+def _stdlib_dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
+JSON_BACKENDS = {"json": (json.loads, _stdlib_dumps)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = (orjson.loads, _orjson_dumps)
+
+_json_loads, _json_dumps = JSON_BACKENDS["orjson" if orjson else "json"]
+
+
+def set_json_backend(name: str, loads=None, dumps=None) -> None:
+    """
+    Selects the JSON library used for the ChatHub protocol. Either a name
+    from JSON_BACKENDS or custom loads/dumps functions can be given.
+    """
+    global _json_loads, _json_dumps
+    if loads is not None and dumps is not None:
+        JSON_BACKENDS[name] = (loads, dumps)
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    _json_loads, _json_dumps = JSON_BACKENDS[name]
+
 
 def _append_identifier(msg: dict) -> str:
     """
     Appends special character to end of message to identify end of message
     """
     # Convert dict to json string
-    return json.dumps(msg, ensure_ascii=False) + DELIMITER
+    return _json_dumps(msg) + DELIMITER
+
+
+class _FrameDecoder:
+    """
+    Incremental decoder for DELIMITER separated ChatHub records.
+    Partial records are kept until the rest arrives in a later message.
+    """
+
+    def __init__(self) -> None:
+        self.buffer: str | bytes = ""
+
+    def feed(self, data: str | bytes) -> list[dict]:
+        """
+        Returns the records completed by data
+        """
+        if isinstance(data, bytes):
+            delimiter = DELIMITER.encode()
+            if isinstance(self.buffer, str):
+                self.buffer = self.buffer.encode()
+        else:
+            delimiter = DELIMITER
+            if isinstance(self.buffer, bytes):
+                self.buffer = self.buffer.decode()
+        if delimiter not in data:
+            self.buffer += data
+            return []
+        if self.buffer:
+            data = self.buffer + data
+        *records, self.buffer = data.split(delimiter)
+        return [_json_loads(record) for record in records if record]
 
 
 def _get_ran_hex(length: int = 32) -> str:
     """
     Returns random hex string
     """
-    return "".join(random.choice("0123456789abcdef") for _ in range(length))
+    return f"{random.getrandbits(length * 4):0{length}x}"
+
+
+DEFAULT_OPTIONS = (
+    "deepleo",
+    "enable_debug_commands",
+    "disable_emoji_spoken_text",
+    "enablemm",
+)
+
+ALLOWED_MESSAGE_TYPES = (
+    "Chat",
+    "Disengaged",
+    "AdsQuery",
+    "SemanticSerp",
+    "GenerateContentQuery",
+    "SearchQuery",
+)
+
+SEARCH_RESULT_MESSAGE_TYPES = (
+    "InternalSearchQuery",
+    "InternalSearchResult",
+    "InternalLoaderMessage",
+    "RenderCardRequest",
+)
+
+SLICE_IDS = (
+    "chk1cf",
+    "nopreloadsscf",
+    "winlongmsg2tf",
+    "perfimpcomb",
+    "sugdivdis",
+    "sydnoinputt",
+    "wpcssopt",
+    "wintone2tf",
+    "0404sydicnbs0",
+    "405suggbs0",
+    "scctl",
+    "330uaugs0",
+    "0329resp",
+    "udscahrfon",
+    "udstrblm5",
+    "404e2ewrt",
+    "408nodedups0",
+    "403tvlansgnd",
+)
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_request_template(options: tuple[str, ...], search_result: bool) -> str:
+    """
+    Serializes the constant part of a ChatHub request once per option set
+    """
+    allowed_message_types = ALLOWED_MESSAGE_TYPES
+    if search_result:
+        allowed_message_types += SEARCH_RESULT_MESSAGE_TYPES
+    return _json_dumps(
+        {
+            "source": "cib",
+            "optionsSets": options,
+            "allowedMessageTypes": allowed_message_types,
+            "sliceIds": SLICE_IDS,
+        },
+    )[1:-1]
 
 
 class _ChatHubRequest:
@@ -180,12 +836,27 @@ class _ChatHubRequest:
         conversation_id: str,
         invocation_id: int = 0,
     ) -> None:
-        self.struct: dict = {}
+        self.payload: str = ""
 
         self.client_id: str = client_id
         self.conversation_id: str = conversation_id
         self.conversation_signature: str = conversation_signature
         self.invocation_id: int = invocation_id
+        # Fields that stay the same for every turn of the conversation
+        self._conversation_fields: str = _json_dumps(
+            {
+                "conversationSignature": conversation_signature,
+                "participant": {"id": client_id},
+                "conversationId": conversation_id,
+            },
+        )[1:-1]
+
+    @property
+    def struct(self) -> dict:
+        """
+        The last request as a dict
+        """
+        return _json_loads(self.payload) if self.payload else {}
 
     def update(
         self,
@@ -198,74 +869,26 @@ class _ChatHubRequest:
         """
         Updates request object
         """
-        if options is None:
-            options = [
-                "deepleo",
-                "enable_debug_commands",
-                "disable_emoji_spoken_text",
-                "enablemm",
-            ]
         if conversation_style:
             if not isinstance(conversation_style, ConversationStyle):
                 conversation_style = getattr(ConversationStyle, conversation_style)
             options = conversation_style.value
-        self.struct = {
-            "arguments": [
-                {
-                    "source": "cib",
-                    "optionsSets": options,
-                    "allowedMessageTypes": [
-                        "Chat",
-                        "Disengaged",
-                        "AdsQuery",
-                        "SemanticSerp",
-                        "GenerateContentQuery",
-                        "SearchQuery",
-                    ],
-                    "sliceIds": [
-                        "chk1cf",
-                        "nopreloadsscf",
-                        "winlongmsg2tf",
-                        "perfimpcomb",
-                        "sugdivdis",
-                        "sydnoinputt",
-                        "wpcssopt",
-                        "wintone2tf",
-                        "0404sydicnbs0",
-                        "405suggbs0",
-                        "scctl",
-                        "330uaugs0",
-                        "0329resp",
-                        "udscahrfon",
-                        "udstrblm5",
-                        "404e2ewrt",
-                        "408nodedups0",
-                        "403tvlansgnd",
-                    ],
-                    "traceId": _get_ran_hex(32),
-                    "isStartOfSession": self.invocation_id == 0,
-                    "message": {
-                        "author": "user",
-                        "inputMethod": "Keyboard",
-                        "text": prompt,
-                        "messageType": "Chat",
-                    },
-                    "conversationSignature": self.conversation_signature,
-                    "participant": {
-                        "id": self.client_id,
-                    },
-                    "conversationId": self.conversation_id,
-                },
-            ],
-            "invocationId": str(self.invocation_id),
-            "target": "chat",
-            "type": 4,
+        template = _compile_request_template(
+            DEFAULT_OPTIONS if options is None else tuple(options),
+            search_result,
+        )
+        fields = {
+            "traceId": _get_ran_hex(32),
+            "isStartOfSession": self.invocation_id == 0,
+            "message": {
+                "author": "user",
+                "inputMethod": "Keyboard",
+                "text": prompt,
+                "messageType": "Chat",
+            },
         }
-        if search_result:
-            have_search_result = ["InternalSearchQuery","InternalSearchResult","InternalLoaderMessage","RenderCardRequest"]
-            self.struct["arguments"][0]["allowedMessageTypes"]+=have_search_result
         if webpage_context:
-            self.struct["arguments"][0]["previousMessages"] = [
+            fields["previousMessages"] = [
                 {
                     "author": "user",
                     "description": webpage_context,
@@ -274,9 +897,80 @@ class _ChatHubRequest:
                     "messageId": "discover-web--page-ping-mriduna-----",
                 }
             ]
+        # Splice the per-turn fields into the precompiled parts
+        self.payload = (
+            '{"arguments":[{'
+            + template
+            + ","
+            + self._conversation_fields
+            + ","
+            + _json_dumps(fields)[1:-1]
+            + '}],"invocationId":"'
+            + str(self.invocation_id)
+            + '","target":"chat","type":4}'
+        )
         self.invocation_id += 1
 
 
+CONVERSATION_ENDPOINTS = [
+    "https://edgeservices.bing.com/edgesvc/turing/conversation/create",
+    "https://edge.churchless.tech/edgesvc/turing/conversation/create",
+]
+
+
+class HedgePolicy:
+    """
+    Decides when a conversation create request is also sent to the next
+    endpoint. With a fixed delay the next endpoint is tried after that many
+    seconds; otherwise the delay follows the latency observed so far.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[str] | None = None,
+        delay: float | None = None,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.1,
+        max_delay: float = 10.0,
+    ) -> None:
+        self.endpoints: list[str] | None = endpoints
+        self.delay: float | None = delay
+        self.initial_delay: float = initial_delay
+        self.min_delay: float = min_delay
+        self.max_delay: float = max_delay
+        # Smoothed latency and deviation per endpoint
+        self.latency: dict[str, tuple[float, float]] = {}
+
+    def get_endpoints(self) -> list[str]:
+        if self.endpoints is not None:
+            return self.endpoints
+        return [
+            os.environ.get("BING_PROXY_URL") or CONVERSATION_ENDPOINTS[0],
+            *CONVERSATION_ENDPOINTS[1:],
+        ]
+
+    def hedge_delay(self, endpoint: str) -> float:
+        if self.delay is not None:
+            return self.delay
+        if endpoint not in self.latency:
+            return self.initial_delay
+        mean, deviation = self.latency[endpoint]
+        return min(max(mean + 4 * deviation, self.min_delay), self.max_delay)
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        if endpoint not in self.latency:
+            self.latency[endpoint] = (seconds, seconds / 2)
+            return
+        mean, deviation = self.latency[endpoint]
+        deviation = 0.75 * deviation + 0.25 * abs(seconds - mean)
+        mean = 0.875 * mean + 0.125 * seconds
+        self.latency[endpoint] = (mean, deviation)
+
+
+# Used by conversation creation unless another policy is passed
+HEDGE_POLICY = HedgePolicy()
+
+
 class _Conversation:
     """
     Conversation API
@@ -288,6 +982,7 @@ class _Conversation:
         proxy: str | None = None,
         async_mode: bool = False,
     ) -> None:
+        self.account: _Account | None = None
         if async_mode:
             return
         self.struct: dict = {
@@ -297,53 +992,44 @@ class _Conversation:
             "result": {"value": "Success", "message": None},
         }
         self.proxy = proxy
-        proxy = (
-            proxy
-            or os.environ.get("all_proxy")
-            or os.environ.get("ALL_PROXY")
-            or os.environ.get("https_proxy")
-            or os.environ.get("HTTPS_PROXY")
-            or None
-        )
-        if proxy is not None and proxy.startswith("socks5h://"):
-            proxy = "socks5://" + proxy[len("socks5h://") :]
-        self.session = httpx.Client(
-            proxies=proxy,
+        with httpx.Client(
+            proxies=_get_proxy(proxy),
             timeout=30,
             headers=HEADERS_INIT_CONVER,
-        )
-        for cookie in cookies:
-            self.session.cookies.set(cookie["name"], cookie["value"])
+        ) as session:
+            for cookie in cookies:
+                session.cookies.set(cookie["name"], cookie["value"])
 
-        # Send GET request
-        response = self.session.get(
-            url=os.environ.get("BING_PROXY_URL")
-            or "https://edgeservices.bing.com/edgesvc/turing/conversation/create",
-        )
-        if response.status_code != 200:
-            response = self.session.get(
-                "https://edge.churchless.tech/edgesvc/turing/conversation/create",
+            # Send GET request
+            response = session.get(
+                url=os.environ.get("BING_PROXY_URL")
+                or "https://edgeservices.bing.com/edgesvc/turing/conversation/create",
             )
-        if response.status_code != 200:
-            print(f"Status code: {response.status_code}")
-            print(response.text)
-            print(response.url)
-            raise Exception("Authentication failed")
+            if response.status_code != 200:
+                response = session.get(
+                    "https://edge.churchless.tech/edgesvc/turing/conversation/create",
+                )
+        _check_status(response, "Authentication failed")
         try:
             self.struct = response.json()
-        except (json.decoder.JSONDecodeError, NotAllowedToAccess) as exc:
-            raise Exception(
+        except json.decoder.JSONDecodeError as exc:
+            raise FatalError(
                 "Authentication failed. You have not been accepted into the beta.",
             ) from exc
         if self.struct["result"]["value"] == "UnauthorizedRequest":
             raise NotAllowedToAccess(self.struct["result"]["message"])
+        self.created_at = time.monotonic()
 
     @staticmethod
     async def create(
         cookies: dict,
         proxy: str | None = None,
+        session: httpx.AsyncClient | None = None,
+        hedge: HedgePolicy | None = None,
+        retry: RetryPolicy | None = None,
     ) -> _Conversation:
         self = _Conversation(async_mode=True)
+        self.account = None
         self.struct = {
             "conversationId": None,
             "clientId": None,
@@ -351,47 +1037,700 @@ class _Conversation:
             "result": {"value": "Success", "message": None},
         }
         self.proxy = proxy
-        proxy = (
-            proxy
-            or os.environ.get("all_proxy")
-            or os.environ.get("ALL_PROXY")
-            or os.environ.get("https_proxy")
-            or os.environ.get("HTTPS_PROXY")
-            or None
-        )
-        if proxy is not None and proxy.startswith("socks5h://"):
-            proxy = "socks5://" + proxy[len("socks5h://") :]
-        async with httpx.AsyncClient(
-            proxies=proxy,
-            timeout=30,
-            headers=HEADERS_INIT_CONVER,
-        ) as client:
-            for cookie in cookies:
-                client.cookies.set(cookie["name"], cookie["value"])
+        retry = retry or RETRY_POLICY
+        if session is None:
+            async with create_session(proxy) as session:
+                self.struct = await retry.run(self._fetch, session, cookies, hedge)
+        else:
+            self.struct = await retry.run(self._fetch, session, cookies, hedge)
+        if self.struct["result"]["value"] == "UnauthorizedRequest":
+            raise NotAllowedToAccess(self.struct["result"]["message"])
+        self.created_at = time.monotonic()
+        return self
 
-            # Send GET request
-            response = await client.get(
-                url=os.environ.get("BING_PROXY_URL")
-                or "https://edgeservices.bing.com/edgesvc/turing/conversation/create",
-            )
-            if response.status_code != 200:
-                response = await client.get(
-                    "https://edge.churchless.tech/edgesvc/turing/conversation/create",
-                )
-        if response.status_code != 200:
-            print(f"Status code: {response.status_code}")
-            print(response.text)
-            print(response.url)
-            raise Exception("Authentication failed")
+    @staticmethod
+    async def _fetch(
+        session: httpx.AsyncClient,
+        cookies: dict,
+        hedge: HedgePolicy | None = None,
+    ) -> dict:
+        response = await _Conversation._request(session, cookies, hedge)
+        _check_status(response, "Authentication failed")
         try:
-            self.struct = response.json()
-        except (json.decoder.JSONDecodeError, NotAllowedToAccess) as exc:
-            raise Exception(
+            return response.json()
+        except json.decoder.JSONDecodeError as exc:
+            raise FatalError(
                 "Authentication failed. You have not been accepted into the beta.",
             ) from exc
-        if self.struct["result"]["value"] == "UnauthorizedRequest":
-            raise NotAllowedToAccess(self.struct["result"]["message"])
-        return self
+
+    @staticmethod
+    async def _request(
+        session: httpx.AsyncClient,
+        cookies: dict,
+        hedge: HedgePolicy | None = None,
+    ) -> httpx.Response:
+        """
+        Sends the create request to the first endpoint and, if it has not
+        answered after the hedge delay or failed, to the next one as well.
+        The first successful response wins and the others are cancelled.
+        Endpoints whose circuit breaker is open are skipped.
+        """
+        hedge = hedge or HEDGE_POLICY
+        endpoints = hedge.get_endpoints()
+        headers = dict(HEADERS_INIT_CONVER, cookie=_cookie_header(cookies))
+        pending: dict[asyncio.Task, tuple[str, float]] = {}
+        response = None
+        error = None
+        next_index = 0
+
+        def launch() -> None:
+            nonlocal next_index
+            while next_index < len(endpoints):
+                endpoint = endpoints[next_index]
+                next_index += 1
+                if get_breaker(endpoint).allow():
+                    # Send GET request
+                    task = asyncio.create_task(session.get(endpoint, headers=headers))
+                    pending[task] = (endpoint, time.perf_counter())
+                    return
+
+        launch()
+        if not pending:
+            raise CircuitOpenError("All conversation endpoints are marked as down")
+        try:
+            while pending:
+                timeout = None
+                if next_index < len(endpoints):
+                    timeout = hedge.hedge_delay(endpoints[next_index - 1])
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    endpoint, started = pending.pop(task)
+                    breaker = get_breaker(endpoint)
+                    try:
+                        result = task.result()
+                    except httpx.HTTPError as exc:
+                        breaker.record_failure()
+                        error = exc
+                        continue
+                    if result.status_code == 429 or result.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    if result.status_code == 200:
+                        hedge.record(endpoint, time.perf_counter() - started)
+                        return result
+                    response = result
+                # Hedge when the request is slow, fall through when all failed
+                if not done or not pending:
+                    launch()
+        finally:
+            for task, (endpoint, _) in pending.items():
+                task.cancel()
+                get_breaker(endpoint).trial = False
+            await asyncio.gather(*pending, return_exceptions=True)
+        if response is None:
+            raise RetryableError(f"Conversation create failed: {error!r}") from error
+        return response
+
+
+class _WarmPool:
+    """
+    Keeps size items per key ready ahead of demand. A background task per
+    key replaces items as they are taken or get older than max_age.
+    Subclasses make items with _make and may extend _expired and _discard.
+    """
+
+    def __init__(self, size: int, max_age: float, retry_delay: float) -> None:
+        self.size: int = size
+        self.max_age: float = max_age
+        self.retry_delay: float = retry_delay
+        self._ready: dict[str, deque] = {}
+        self._wakeups: dict[str, asyncio.Event] = {}
+        self._refills: dict[str, asyncio.Task] = {}
+
+    async def _make(self, *args):
+        raise NotImplementedError
+
+    @staticmethod
+    def _created_at(item) -> float:
+        return item.created_at
+
+    def _expired(self, item) -> bool:
+        return time.monotonic() - self._created_at(item) >= self.max_age
+
+    async def _discard(self, item) -> None:
+        pass
+
+    def _ensure_refill(self, key: str, *args) -> None:
+        task = self._refills.get(key)
+        if task is None or task.done():
+            self._wakeups[key] = asyncio.Event()
+            self._refills[key] = asyncio.create_task(self._refill(key, *args))
+        else:
+            self._wakeups[key].set()
+
+    async def _refill(self, key: str, *args) -> None:
+        """
+        Keep the items for one key ready and fresh
+        """
+        ready = self._ready.setdefault(key, deque())
+        wakeup = self._wakeups[key]
+        while True:
+            while ready and self._expired(ready[0]):
+                await self._discard(ready.popleft())
+            if len(ready) < self.size:
+                try:
+                    ready.append(await self._make(*args))
+                except Exception:
+                    # Callers see the error through the direct path
+                    await asyncio.sleep(self.retry_delay)
+                continue
+            wakeup.clear()
+            # Sleep until an item is taken or the oldest one expires
+            timeout = self.max_age - (time.monotonic() - self._created_at(ready[0]))
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _take(self, key: str, *args):
+        """
+        Take a ready item for key, or None if none is ready
+        """
+        ready = self._ready.setdefault(key, deque())
+        item = None
+        while ready:
+            candidate = ready.popleft()
+            if not self._expired(candidate):
+                item = candidate
+                break
+            asyncio.create_task(self._discard(candidate))
+        self._ensure_refill(key, *args)
+        return item
+
+    async def _warm(self, key: str, *args) -> None:
+        """
+        Fill the items for key and wait until they are ready
+        """
+        ready = self._ready.setdefault(key, deque())
+        missing = self.size - len(ready)
+        if missing > 0:
+            ready.extend(
+                await asyncio.gather(*(self._make(*args) for _ in range(missing))),
+            )
+        self._ensure_refill(key, *args)
+
+    async def close(self) -> None:
+        """
+        Stop background refills and discard all ready items
+        """
+        for task in self._refills.values():
+            task.cancel()
+        await asyncio.gather(*self._refills.values(), return_exceptions=True)
+        self._refills.clear()
+        self._wakeups.clear()
+        for ready in self._ready.values():
+            for item in ready:
+                await self._discard(item)
+        self._ready.clear()
+
+
+class ConversationPool(_WarmPool):
+    """
+    Keeps pre-created conversations ready so new chats can start immediately
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_age: float = 600,
+        retry_delay: float = 5,
+        session: httpx.AsyncClient | None = None,
+    ) -> None:
+        # Conversations are discarded before their signatures go stale
+        super().__init__(size, max_age, retry_delay)
+        # One pooled HTTP client per proxy unless a shared one is given
+        self.session: httpx.AsyncClient | None = session
+        self._sessions: dict[str | None, httpx.AsyncClient] = {}
+
+    def _get_session(self, proxy: str | None) -> httpx.AsyncClient:
+        if self.session is not None:
+            return self.session
+        if proxy not in self._sessions:
+            self._sessions[proxy] = create_session(proxy)
+        return self._sessions[proxy]
+
+    async def _make(self, cookies: list[dict], proxy: str | None) -> _Conversation:
+        return await _Conversation.create(
+            cookies,
+            proxy,
+            session=self._get_session(proxy),
+        )
+
+    @staticmethod
+    def _key(cookies: list[dict], proxy: str | None) -> str:
+        pairs = sorted((cookie["name"], cookie["value"]) for cookie in cookies)
+        return hashlib.sha256(json.dumps([pairs, proxy]).encode()).hexdigest()
+
+    async def get(
+        self,
+        cookies: list[dict],
+        proxy: str | None = None,
+    ) -> _Conversation:
+        """
+        Take a ready conversation, creating one directly if none is available
+        """
+        conversation = self._take(self._key(cookies, proxy), cookies, proxy)
+        if conversation is None:
+            conversation = await self._make(cookies, proxy)
+        return conversation
+
+    async def warm(self, cookies: list[dict], proxy: str | None = None) -> None:
+        """
+        Fill the pool for a cookie set and wait until it is ready
+        """
+        await self._warm(self._key(cookies, proxy), cookies, proxy)
+
+    async def close(self) -> None:
+        """
+        Stop background refills and drop all pooled conversations
+        """
+        await super().close()
+        for session in self._sessions.values():
+            await session.aclose()
+        self._sessions.clear()
+
+
+class NoAccountAvailable(Exception):
+    pass
+
+
+class _Account:
+    """
+    One set of cookies managed by AccountScheduler
+    """
+
+    def __init__(self, name: str, cookies: list[dict]) -> None:
+        self.name: str = name
+        self.cookies: list[dict] = cookies
+        # Conversations currently using this account
+        self.active: int = 0
+        self.disabled_until: float = 0.0
+        self.last_error: Exception | None = None
+        self.breaker: CircuitBreaker = get_breaker(f"account:{name}")
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.disabled_until and self.breaker.available
+
+
+class AccountScheduler:
+    """
+    Spreads new conversations over several accounts by their current load
+    and takes throttled or unauthorized accounts out of rotation for a while
+    """
+
+    def __init__(
+        self,
+        cookie_dir: str | Path | None = None,
+        cookies: list[list[dict]] | None = None,
+        cooldown: float = 600,
+        throttle_cooldown: float = 3600,
+    ) -> None:
+        self.accounts: list[_Account] = []
+        self.cooldown: float = cooldown
+        self.throttle_cooldown: float = throttle_cooldown
+        if cookie_dir is not None:
+            for path in sorted(Path(cookie_dir).glob("*.json")):
+                self.accounts.append(_Account(path.stem, COOKIE_STORE.load(path)))
+        for index, account_cookies in enumerate(cookies or []):
+            self.accounts.append(_Account(str(index), account_cookies))
+        if not self.accounts:
+            raise ValueError("No accounts found")
+
+    def acquire(self, exclude: Iterable[_Account] = ()) -> _Account:
+        """
+        Returns the least loaded account that is in rotation
+        """
+        candidates = [
+            account
+            for account in self.accounts
+            if account.available and account not in exclude
+        ]
+        if not candidates:
+            raise NoAccountAvailable("All accounts are out of rotation")
+        account = min(candidates, key=lambda account: account.active)
+        account.active += 1
+        return account
+
+    def release(self, account: _Account) -> None:
+        account.active = max(account.active - 1, 0)
+
+    def disable(
+        self,
+        account: _Account,
+        cooldown: float | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        """
+        Takes an account out of rotation for cooldown seconds
+        """
+        if cooldown is None:
+            cooldown = self.cooldown
+        account.disabled_until = time.monotonic() + cooldown
+        account.last_error = error
+
+    def report(self, account: _Account, response: dict) -> None:
+        """
+        Checks a final ChatHub response for throttling or authorization errors
+        """
+        result = response.get("item", {}).get("result", {}).get("value")
+        if result == "Throttled":
+            self.disable(account, self.throttle_cooldown)
+            account.breaker.record_failure()
+        elif result == "UnauthorizedRequest":
+            self.disable(account)
+            account.breaker.record_failure()
+
+    async def create_conversation(
+        self,
+        proxy: str | None = None,
+        session: httpx.AsyncClient | None = None,
+        pool: ConversationPool | None = None,
+        retry: RetryPolicy | None = None,
+    ) -> _Conversation:
+        """
+        Creates a conversation on the least loaded working account. The
+        account is attached as conversation.account and must be released.
+        """
+        tried = []
+        while True:
+            account = self.acquire(exclude=tried)
+            tried.append(account)
+            try:
+                if pool is not None:
+                    conversation = await pool.get(account.cookies, proxy)
+                else:
+                    conversation = await _Conversation.create(
+                        account.cookies,
+                        proxy,
+                        session=session,
+                        retry=retry,
+                    )
+            except (RetryableError, CircuitOpenError):
+                # Network problems are not the account's fault; its breaker
+                # would otherwise stay open after the upstream recovers
+                self.release(account)
+                raise
+            except Exception as exc:
+                self.release(account)
+                self.disable(account, error=exc)
+                account.breaker.record_failure()
+                continue
+            account.breaker.record_success()
+            conversation.account = account
+            return conversation
+
+
+class _TurnTimeouts:
+    """
+    Time limits of one turn, all optional and in seconds
+    """
+
+    def __init__(
+        self,
+        deadline: float | None = None,
+        first_token_timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ) -> None:
+        now = time.monotonic()
+        self.deadline: float | None = None if deadline is None else now + deadline
+        self.first_token_timeout: float | None = first_token_timeout
+        self.idle_timeout: float | None = idle_timeout
+        self.sent_at: float | None = None
+        self.last_frame: float = now
+        self.got_token: bool = False
+
+    def sent(self) -> None:
+        self.sent_at = self.last_frame = time.monotonic()
+
+    def _limit(self, idle: bool) -> tuple[float, str] | None:
+        limits = []
+        if self.deadline is not None:
+            limits.append((self.deadline, "Turn deadline exceeded"))
+        if (
+            self.first_token_timeout is not None
+            and self.sent_at is not None
+            and not self.got_token
+        ):
+            limits.append(
+                (
+                    self.sent_at + self.first_token_timeout,
+                    f"No token within {self.first_token_timeout}s",
+                ),
+            )
+        if idle and self.idle_timeout is not None:
+            limits.append(
+                (
+                    self.last_frame + self.idle_timeout,
+                    f"Stream idle for {self.idle_timeout}s",
+                ),
+            )
+        return min(limits) if limits else None
+
+    async def _wait(self, awaitable, idle: bool):
+        limit = self._limit(idle)
+        if limit is None:
+            return await awaitable
+        until, message = limit
+        try:
+            return await asyncio.wait_for(awaitable, max(until - time.monotonic(), 0))
+        except asyncio.TimeoutError as exc:
+            raise StreamTimeout(message) from exc
+
+    async def limit(self, awaitable):
+        """
+        Awaits a step that is only bound by the deadline
+        """
+        return await self._wait(awaitable, idle=False)
+
+    async def recv(self, wss: websockets.WebSocketClientProtocol) -> str | bytes:
+        data = await self._wait(wss.recv(), idle=True)
+        self.last_frame = time.monotonic()
+        return data
+
+
+def _merge_updates(
+    previous: Union[str, dict, StreamDelta],
+    update: Union[str, dict, StreamDelta],
+) -> Union[str, StreamDelta, None]:
+    """
+    Combines two consecutive updates into one, or returns None if they
+    cannot be merged (raw frames)
+    """
+    if isinstance(update, str):
+        # Full text updates already contain everything before them
+        return update
+    if not isinstance(update, StreamDelta) or not isinstance(previous, StreamDelta):
+        return None
+    if update.offset < previous.offset:
+        return StreamDelta(update.text, update.offset, revoked=True)
+    # Rewriting text the consumer has not seen yet is not a revocation
+    return StreamDelta(
+        previous.text[: update.offset - previous.offset] + update.text,
+        previous.offset,
+        previous.revoked,
+    )
+
+
+class _UpdateBuffer:
+    """
+    Bounded queue between the websocket reader task and the consumer of
+    ask_stream. Final responses and errors are never merged or dropped.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        overflow: OVERFLOW_POLICY_TYPE = "coalesce",
+        metrics: Metrics | None = None,
+    ) -> None:
+        if overflow not in ("coalesce", "block", "latest"):
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.size: int = size
+        self.overflow: OVERFLOW_POLICY_TYPE = overflow
+        self.metrics: Metrics = metrics or METRICS
+        self.items: deque[tuple[bool, Union[str, dict, StreamDelta]]] = deque()
+        self.error: Exception | None = None
+        self.condition: asyncio.Condition = asyncio.Condition()
+
+    def _merge(self, update: Union[str, dict, StreamDelta]) -> bool:
+        if self.overflow == "block" or not self.items or self.items[-1][0]:
+            return False
+        if self.overflow == "coalesce" and len(self.items) < self.size:
+            return False
+        merged = _merge_updates(self.items[-1][1], update)
+        if merged is None:
+            return False
+        self.items[-1] = (False, merged)
+        self.metrics.inc("updates_coalesced")
+        return True
+
+    async def put(self, final: bool, update: Union[str, dict, StreamDelta]) -> None:
+        async with self.condition:
+            if final or not self._merge(update):
+                await self.condition.wait_for(lambda: len(self.items) < self.size)
+                self.items.append((final, update))
+            self.condition.notify_all()
+
+    async def fail(self, error: Exception) -> None:
+        async with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+    async def get(self) -> tuple[bool, Union[str, dict, StreamDelta]]:
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: self.items or self.error is not None,
+            )
+            if not self.items:
+                raise self.error
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+
+async def _open_websocket(
+    wss_link: str,
+    metrics: Metrics | None = None,
+) -> tuple[websockets.WebSocketClientProtocol, _FrameDecoder]:
+    """
+    Connects to ChatHub through the DNS cache and performs the protocol
+    handshake
+    """
+    metrics = metrics or METRICS
+    uri = parse_uri(wss_link)
+    wss = None
+    try:
+        with metrics.timer("websocket_connect"):
+            addresses = await DNS_CACHE.resolve(uri.host, uri.port)
+            # Like create_connection, try every address; on dual-stack hosts
+            # the first one is often an unreachable IPv6 address
+            for index, address in enumerate(addresses):
+                try:
+                    wss = await websockets.connect(
+                        wss_link,
+                        extra_headers=HEADERS,
+                        max_size=None,
+                        host=address,
+                        port=uri.port,
+                        ssl=ssl_context if uri.secure else None,
+                        server_hostname=uri.host if uri.secure else None,
+                    )
+                except (OSError, asyncio.TimeoutError):
+                    if index == len(addresses) - 1:
+                        raise
+                    metrics.inc("websocket_address_failures")
+                    continue
+                if index:
+                    DNS_CACHE.prefer(uri.host, uri.port, address)
+                break
+        decoder = _FrameDecoder()
+        with metrics.timer("handshake"):
+            await wss.send(_append_identifier({"protocol": "json", "version": 1}))
+            while not decoder.feed(await wss.recv()):
+                pass
+    except InvalidStatusCode as exc:
+        message = f"Websocket connect failed with status {exc.status_code}"
+        if exc.status_code == 429 or exc.status_code >= 500:
+            raise RetryableError(message) from exc
+        raise FatalError(message) from exc
+    except (
+        OSError,
+        asyncio.TimeoutError,
+        InvalidHandshake,
+        ConnectionClosed,
+    ) as exc:
+        # The address may be stale, resolve it again next time
+        DNS_CACHE.invalidate(uri.host, uri.port)
+        if wss is not None:
+            await wss.close()
+        raise RetryableError(f"Websocket connect failed: {exc!r}") from exc
+    return wss, decoder
+
+
+class StandbyConnections(_WarmPool):
+    """
+    Keeps handshaken ChatHub websockets open ahead of demand so the first
+    turn of a conversation does not wait for DNS, TLS or the handshake
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        max_age: float = 60,
+        retry_delay: float = 5,
+        metrics: Metrics | None = None,
+    ) -> None:
+        # Idle sockets are replaced before the server drops them
+        super().__init__(size, max_age, retry_delay)
+        self.metrics: Metrics = metrics or METRICS
+
+    @staticmethod
+    def _created_at(item: tuple) -> float:
+        return item[0]
+
+    def _expired(self, item: tuple) -> bool:
+        return not item[1].open or super()._expired(item)
+
+    async def _discard(self, item: tuple) -> None:
+        await item[1].close()
+
+    async def _make(self, wss_link: str) -> tuple:
+        wss, decoder = await _open_websocket(wss_link, self.metrics)
+        return time.monotonic(), wss, decoder
+
+    def take(
+        self,
+        wss_link: str,
+    ) -> tuple[websockets.WebSocketClientProtocol, _FrameDecoder] | None:
+        """
+        Take an open websocket for wss_link, or None if none is ready
+        """
+        entry = self._take(wss_link, wss_link)
+        if entry is None:
+            return None
+        self.metrics.inc("websocket_standby")
+        return entry[1], entry[2]
+
+    async def warm(self, wss_link: str) -> None:
+        """
+        Open the standby sockets for wss_link and wait until they are ready
+        """
+        await self._warm(wss_link, wss_link)
+
+
+async def warm_up(
+    wss_link: str = "wss://sydney.bing.com/sydney/ChatHub",
+    session: httpx.AsyncClient | None = None,
+    standby: StandbyConnections | None = None,
+    proxy: str | None = None,
+) -> None:
+    """
+    Resolves the upstream hosts and primes the TLS session cache, meant to
+    run once at process start. Passing session leaves warm REST connections
+    in its pool and passing standby fills it for wss_link. Failures are
+    ignored, the first real request simply pays the cost instead.
+    """
+    hosts = {urlsplit(url).hostname for url in CONVERSATION_ENDPOINTS}
+    await asyncio.gather(
+        *(DNS_CACHE.resolve(host, 443) for host in hosts),
+        return_exceptions=True,
+    )
+
+    async def connect_websocket() -> None:
+        if standby is not None:
+            await standby.warm(wss_link)
+        else:
+            wss, _ = await _open_websocket(wss_link)
+            await wss.close()
+
+    async def connect_rest() -> None:
+        client = session or create_session(proxy)
+        try:
+            await asyncio.gather(
+                *(client.head(f"https://{host}/") for host in hosts),
+                return_exceptions=True,
+            )
+        finally:
+            if session is None:
+                await client.aclose()
+
+    await asyncio.gather(connect_websocket(), connect_rest(), return_exceptions=True)
 
 
 class _ChatHub:
@@ -399,8 +1738,22 @@ class _ChatHub:
     Chat API
     """
 
-    def __init__(self, conversation: _Conversation) -> None:
+    def __init__(
+        self,
+        conversation: _Conversation,
+        keep_alive: bool = False,
+        idle_ping_after: float = 10,
+        ping_timeout: float = 5,
+        proxy: str | None = None,
+        session: httpx.AsyncClient | None = None,
+        metrics: Metrics | None = None,
+        retry: RetryPolicy | None = None,
+        standby: StandbyConnections | None = None,
+        images: ImageCache | None = None,
+    ) -> None:
         self.wss: websockets.WebSocketClientProtocol | None = None
+        self.wss_link: str | None = None
+        self.decoder: _FrameDecoder = _FrameDecoder()
         self.request: _ChatHubRequest
         self.loop: bool
         self.task: asyncio.Task
@@ -409,6 +1762,64 @@ class _ChatHub:
             client_id=conversation.struct["clientId"],
             conversation_id=conversation.struct["conversationId"],
         )
+        # Persistent connection settings
+        self.keep_alive: bool = keep_alive
+        self.idle_ping_after: float = idle_ping_after
+        self.ping_timeout: float = ping_timeout
+        self.last_active: float = 0.0
+        # Token of the turn reading from the websocket, until it finishes
+        self._turn: object | None = None
+        self.proxy: str | None = proxy
+        self.session: httpx.AsyncClient | None = session
+        self.metrics: Metrics = metrics or METRICS
+        self.retry: RetryPolicy = retry or RETRY_POLICY
+        self.standby: StandbyConnections | None = standby
+        self.images: ImageCache | None = images
+
+    async def _connect(self, wss_link: str) -> bool:
+        """
+        Open the websocket, reusing the current one or a standby one if
+        possible. Returns True if an already open connection was used
+        """
+        if self._turn is not None:
+            # An earlier turn was abandoned before its generator was closed,
+            # the rest of its answer is still on the socket
+            self._abort()
+        if self.keep_alive and wss_link == self.wss_link and await self._is_alive():
+            self.metrics.inc("websocket_reused")
+            return True
+        await self.close()
+        standby = self.standby.take(wss_link) if self.standby is not None else None
+        if standby is not None:
+            self.wss, self.decoder = standby
+            reused = True
+        else:
+            self.wss, self.decoder = await self.retry.run(
+                _open_websocket,
+                wss_link,
+                self.metrics,
+                breaker=get_breaker(wss_link),
+            )
+            reused = False
+        self.wss_link = wss_link
+        self.last_active = time.monotonic()
+        return reused
+
+    async def _is_alive(self) -> bool:
+        """
+        Check whether the current websocket can be used for another turn
+        """
+        if self.wss is None or not self.wss.open:
+            return False
+        if time.monotonic() - self.last_active < self.idle_ping_after:
+            return True
+        # The socket has been idle for a while, make sure the peer is still there
+        try:
+            pong = await self.wss.ping()
+            await asyncio.wait_for(pong, timeout=self.ping_timeout)
+        except (asyncio.TimeoutError, ConnectionClosed):
+            return False
+        return True
 
     async def ask_stream(
         self,
@@ -419,126 +1830,211 @@ class _ChatHub:
         raw: bool = False,
         options: dict = None,
         webpage_context: str | None = None,
-        search_result : bool = False
+        search_result : bool = False,
+        delta: bool = False,
+        buffer: int = 0,
+        overflow: OVERFLOW_POLICY_TYPE = "coalesce",
+        deadline: float | None = None,
+        first_token_timeout: float | None = None,
+        idle_timeout: float | None = None,
     ) -> Generator[str, None, None]:
         """
-        Ask a question to the bot
+        Ask a question to the bot. With buffer > 0 a separate task reads the
+        websocket into a queue of that size, so a slow consumer does not
+        stall the socket; overflow decides what happens when it is full.
+
+        deadline bounds the whole turn, first_token_timeout the wait for the
+        first token after sending and idle_timeout the gap between frames,
+        all in seconds. Exceeding one raises StreamTimeout. A turn that does
+        not finish drops its websocket, the next turn reconnects.
         """
-        if self.wss and not self.wss.closed:
-            await self.wss.close()
-        # Check if websocket is closed
-        self.wss = await websockets.connect(
-            wss_link,
-            extra_headers=HEADERS,
-            max_size=None,
-            ssl=ssl_context,
-        )
-        await self._initial_handshake()
-        if self.request.invocation_id == 0:
-            # Construct a ChatHub request
-            self.request.update(
-                prompt=prompt,
-                conversation_style=conversation_style,
-                options=options,
-                webpage_context=webpage_context,
-                search_result=search_result
-            )
-        else:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://sydney.bing.com/sydney/UpdateConversation/",
-                    json={
-                        "messages": [
-                            {
-                                "author": "user",
-                                "description": webpage_context,
-                                "contextType": "WebPage",
-                                "messageType": "Context",
-                            }
-                        ],
-                        "conversationId": self.request.conversation_id,
-                        "source": "cib",
-                        "traceId": _get_ran_hex(32),
-                        "participant": {"id": self.request.client_id},
-                        "conversationSignature": self.request.conversation_signature,
-                    },
+        started = time.perf_counter()
+        timeouts = _TurnTimeouts(deadline, first_token_timeout, idle_timeout)
+        turn = object()
+        finished = False
+        try:
+            reused = await timeouts.limit(self._connect(wss_link))
+            self._turn = turn
+            if self.request.invocation_id == 0:
+                # Construct a ChatHub request
+                self.request.update(
+                    prompt=prompt,
+                    conversation_style=conversation_style,
+                    options=options,
+                    webpage_context=webpage_context,
+                    search_result=search_result
                 )
-            if response.status_code != 200:
-                print(f"Status code: {response.status_code}")
-                print(response.text)
-                print(response.url)
-                raise Exception("Update web page context failed")
-            # Construct a ChatHub request
-            self.request.update(
-                prompt=prompt,
-                conversation_style=conversation_style,
-                options=options,
-            )
-        # Send request
-        await self.wss.send(_append_identifier(self.request.struct))
+            else:
+                with self.metrics.timer("update_conversation"):
+                    await timeouts.limit(
+                        self.retry.run(
+                            self._update_conversation,
+                            webpage_context,
+                            wss_link,
+                            breaker=get_breaker(_update_conversation_url(wss_link)),
+                        ),
+                    )
+                # Construct a ChatHub request
+                self.request.update(
+                    prompt=prompt,
+                    conversation_style=conversation_style,
+                    options=options,
+                )
+            # Send request
+            payload = self.request.payload + DELIMITER
+            try:
+                await self.wss.send(payload)
+                sent = time.perf_counter()
+                timeouts.sent()
+                data = await timeouts.recv(self.wss)
+            except ConnectionClosed:
+                if not reused:
+                    raise
+                # The reused socket died while idle, reconnect once and resend
+                await self.close()
+                await timeouts.limit(self._connect(wss_link))
+                self._turn = turn
+                await self.wss.send(payload)
+                sent = time.perf_counter()
+                timeouts.sent()
+                data = await timeouts.recv(self.wss)
+            self.metrics.inc("sent_bytes", len(payload.encode()))
+            updates = self._receive(data, started, sent, cookies, raw, delta, timeouts)
+            if not buffer:
+                async for final, response in updates:
+                    finished = final
+                    if final:
+                        self._turn = None
+                    yield final, response
+                return
+            queue = _UpdateBuffer(buffer, overflow, self.metrics)
+
+            async def read() -> None:
+                try:
+                    async for final, response in updates:
+                        await queue.put(final, response)
+                except Exception as exc:
+                    await queue.fail(exc)
+
+            reader = asyncio.create_task(read())
+            try:
+                while not finished:
+                    final, response = await queue.get()
+                    finished = final
+                    if final:
+                        self._turn = None
+                    yield final, response
+            finally:
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+        finally:
+            # The consumer stopped early, the turn failed or the task was
+            # cancelled; what is left of the stream would confuse the next turn.
+            # A later turn may already own the hub, its socket is left alone
+            if not finished and self._turn is turn:
+                self._abort()
+
+    async def _receive(
+        self,
+        data: str | bytes,
+        started: float,
+        sent: float,
+        cookies: list[dict],
+        raw: bool,
+        delta: bool,
+        timeouts: _TurnTimeouts,
+    ) -> AsyncGenerator[tuple[bool, Union[str, dict, StreamDelta]], None]:
+        """
+        Reads the updates of one turn from the websocket
+        """
+        last_token = None
         final = False
         draw = False
-        resp_txt = ""
-        result_text = ""
-        resp_txt_no_link = ""
+        images: list[GeneratedImage] = []
+        # Text of finished messages (e.g. search queries) and of the one
+        # being streamed; the full response is only joined when needed
+        committed_text = ""
+        current = ""
+        current_no_link = ""
+        # Part of the current message already handed out in delta mode
+        streamed = ""
+        streamed_at = 0
         while not final:
-            objects = str(await self.wss.recv()).split(DELIMITER)
-            for obj in objects:
-                if obj is None or not obj:
-                    continue
-                response = json.loads(obj)
+            if data is None:
+                data = await timeouts.recv(self.wss)
+            self.metrics.inc("frames")
+            self.metrics.inc(
+                "received_bytes",
+                len(data) if isinstance(data, bytes) else len(data.encode()),
+            )
+            responses = self.decoder.feed(data)
+            data = None
+            self.last_active = time.monotonic()
+            for response in responses:
+                if response.get("type") == 1 and response["arguments"][0].get(
+                    "messages",
+                ):
+                    now = time.perf_counter()
+                    if last_token is None:
+                        self.metrics.observe("time_to_first_token", now - sent)
+                        timeouts.got_token = True
+                    else:
+                        self.metrics.observe("inter_token", now - last_token)
+                    last_token = now
                 if response.get("type") != 2 and raw:
                     yield False, response
                 elif response.get("type") == 1 and response["arguments"][0].get(
                     "messages",
                 ):
-                    try:
+                    message = response["arguments"][0]["messages"][0]
+                    if message.get("contentType") == "IMAGE":
                         if not draw:
-                            if (
-                                response["arguments"][0]["messages"][0]["contentOrigin"]
-                                != "Apology"
-                            ):
-                                resp_txt = result_text+response["arguments"][0]["messages"][0][
-                                    "adaptiveCards"
-                                ][0]["body"][0].get("text", "")
-                                resp_txt_no_link = result_text+response["arguments"][0]["messages"][
-                                    0
-                                ].get("text", "")
-                                if(response["arguments"][0]["messages"][0].get("messageType")):
-                                    resp_txt = resp_txt+response["arguments"][0]["messages"][0][
-                                    "adaptiveCards"
-                                    ][0]["body"][0]["inlines"][0].get("text")+"\n"
-                                    result_text = result_text+response["arguments"][0]["messages"][0][
-                                    "adaptiveCards"
-                                    ][0]["body"][0]["inlines"][0].get("text")+"\n"
-                        yield False, resp_txt
-                    except Exception as exc:
-                        print(exc)
-                        if not draw:
-                            continue
-                        for item in cookies:
-                            if item["name"] == "_U":
-                                U = item["value"]
-                        async with ImageGenAsync(U, True) as image_generator:
-                            images = await image_generator.get_images(
-                                response["arguments"][0]["messages"][0]["text"],
+                            # Bing asks the client to draw the message text
+                            draw = True
+                            images = await self._draw(message["text"], cookies)
+                            # Drawing takes longer than any gap between frames
+                            timeouts.last_frame = time.monotonic()
+                            current = current + "".join(
+                                f"\n![image{index}]({image.url})"
+                                for index, image in enumerate(images)
                             )
-                        cache = resp_txt
-                        resp_txt = (
-                            cache
-                            + "\n![image0]("
-                            + images[0]
-                            + ")\n![image1]("
-                            + images[1]
-                            + ")\n![image0]("
-                            + images[2]
-                            + ")\n![image3]("
-                            + images[3]
-                            + ")"
+                    elif not draw:
+                        try:
+                            if message["contentOrigin"] != "Apology":
+                                body = message["adaptiveCards"][0]["body"][0]
+                                current = body.get("text", "")
+                                current_no_link = message.get("text", "")
+                                if message.get("messageType"):
+                                    committed_text = (
+                                        committed_text
+                                        + current
+                                        + body["inlines"][0].get("text")
+                                        + "\n"
+                                    )
+                                    current = ""
+                                    current_no_link = ""
+                        except Exception as exc:
+                            print(exc)
+                            continue
+                    if not delta:
+                        yield False, committed_text + current
+                        continue
+                    region = committed_text[streamed_at:] + current
+                    if region.startswith(streamed):
+                        chunk = StreamDelta(
+                            region[len(streamed) :],
+                            streamed_at + len(streamed),
                         )
-                        yield False, resp_txt
+                    else:
+                        chunk = StreamDelta(region, streamed_at, revoked=True)
+                    streamed = current
+                    streamed_at = len(committed_text)
+                    if chunk.text or chunk.revoked:
+                        yield False, chunk
                 elif response.get("type") == 2:
+                    resp_txt = committed_text + current
                     if draw:
+                        response["images"] = [image._asdict() for image in images]
                         cache = response["item"]["messages"][1]["adaptiveCards"][0][
                             "body"
                         ][0]["text"]
@@ -549,7 +2045,9 @@ class _ChatHub:
                         response["item"]["messages"][-1]["contentOrigin"] == "Apology"
                         and resp_txt
                     ):
-                        response["item"]["messages"][-1]["text"] = resp_txt_no_link
+                        response["item"]["messages"][-1]["text"] = (
+                            committed_text + current_no_link
+                        )
                         response["item"]["messages"][-1]["adaptiveCards"][0]["body"][0][
                             "text"
                         ] = resp_txt
@@ -557,11 +2055,76 @@ class _ChatHub:
                             f"Preserved the message from being deleted", file=sys.stderr
                         )
                     final = True
+                    self.metrics.observe("turn", time.perf_counter() - started)
+                    self.metrics.inc("turns")
                     yield True, response
 
-    async def _initial_handshake(self) -> None:
-        await self.wss.send(_append_identifier({"protocol": "json", "version": 1}))
-        await self.wss.recv()
+    async def _draw(self, prompt: str, cookies: list[dict]) -> list[GeneratedImage]:
+        """
+        Draws prompt; failures are reported on stderr and the answer keeps
+        its text
+        """
+        try:
+            if self.images is not None:
+                return await self.images.generate(prompt, cookies, self.metrics)
+            async with ImageGenAsync(
+                _cookie_value(cookies, "_U"),
+                quiet=True,
+            ) as image_generator:
+                return [
+                    GeneratedImage(url)
+                    for url in await image_generator.get_images(prompt)
+                ]
+        except Exception as exc:
+            print(f"Image generation failed: {exc}", file=sys.stderr)
+            self.metrics.inc("image_errors")
+            return []
+
+    async def _update_conversation(
+        self,
+        webpage_context: str | None,
+        wss_link: str,
+    ) -> httpx.Response:
+        """
+        Send the web page context for a follow-up turn
+        """
+        json_data = {
+            "messages": [
+                {
+                    "author": "user",
+                    "description": webpage_context,
+                    "contextType": "WebPage",
+                    "messageType": "Context",
+                }
+            ],
+            "conversationId": self.request.conversation_id,
+            "source": "cib",
+            "traceId": _get_ran_hex(32),
+            "participant": {"id": self.request.client_id},
+            "conversationSignature": self.request.conversation_signature,
+        }
+        url = _update_conversation_url(wss_link)
+        try:
+            if self.session is None:
+                async with create_session(self.proxy) as session:
+                    response = await session.post(url, json=json_data)
+            else:
+                response = await self.session.post(url, json=json_data)
+        except httpx.HTTPError as exc:
+            raise RetryableError(f"Update web page context failed: {exc!r}") from exc
+        _check_status(response, "Update web page context failed")
+        return response
+
+    def _abort(self) -> None:
+        """
+        Drop the connection without a closing handshake
+        """
+        if self.wss is not None:
+            self.wss.transport.abort()
+            self.metrics.inc("turns_aborted")
+        self.wss = None
+        self.wss_link = None
+        self._turn = None
 
     async def close(self) -> None:
         """
@@ -569,6 +2132,380 @@ class _ChatHub:
         """
         if self.wss and not self.wss.closed:
             await self.wss.close()
+        self.wss = None
+        self.wss_link = None
+        self._turn = None
+
+
+@contextlib.asynccontextmanager
+async def _aclosing(generator: AsyncGenerator):
+    """
+    contextlib.aclosing, which only exists from Python 3.10
+    """
+    try:
+        yield generator
+    finally:
+        await generator.aclose()
+
+
+def _response_text(response: dict) -> str:
+    """
+    Returns the text of the bot's answer in a final response
+    """
+    message = response["item"]["messages"][-1]
+    try:
+        return message["adaptiveCards"][0]["body"][0]["text"]
+    except (KeyError, IndexError):
+        return message.get("text", "")
+
+
+def _is_cacheable(response: dict) -> bool:
+    item = response.get("item", {})
+    if item.get("result", {}).get("value", "Success") != "Success":
+        return False
+    messages = item.get("messages") or []
+    return (
+        len(messages) > 1
+        and messages[-1].get("author") == "bot"
+        and messages[-1].get("contentOrigin") != "Apology"
+        and bool(_response_text(response))
+    )
+
+
+class ResponseCache:
+    """
+    Caches final responses to first turns of conversations. Entries live in
+    an in-memory LRU and, if a path is given, in a SQLite database.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_entries: int = 1024,
+        ttl: float = 86400,
+    ) -> None:
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, created REAL, response TEXT)",
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(
+        prompt: str,
+        conversation_style: CONVERSATION_STYLE_TYPE = None,
+        options: list | None = None,
+        webpage_context: str | None = None,
+        search_result: bool = False,
+    ) -> str:
+        if isinstance(conversation_style, ConversationStyle):
+            conversation_style = conversation_style.name
+        context_hash = (
+            hashlib.sha256(webpage_context.encode()).hexdigest()
+            if webpage_context
+            else None
+        )
+        return hashlib.sha256(
+            json.dumps(
+                [prompt, conversation_style, options, context_hash, search_result],
+            ).encode(),
+        ).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT created, response FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[0] >= self.ttl:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        response = _json_loads(row[1])
+        self._remember(key, row[0], response)
+        return response
+
+    def set(self, key: str, response: dict) -> None:
+        now = time.time()
+        self._remember(key, now, response)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, now, _json_dumps(response)),
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, created: float, response: dict) -> None:
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class ImageCache:
+    """
+    Downloads generated images concurrently over one pooled client and
+    stores them under path, named by the SHA-256 of their content. A
+    SQLite index maps prompt and URL to the file, and prompt to the URLs
+    Bing drew for it, so repeated prompts need no network at all.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 16 * 2**20,
+        concurrency: int = 4,
+        proxy: str | None = None,
+        session: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.path: Path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Larger downloads are abandoned
+        self.max_bytes: int = max_bytes
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.proxy: str | None = proxy
+        self._owns_session: bool = session is None
+        self.session: httpx.AsyncClient | None = session
+        self._db: sqlite3.Connection = sqlite3.connect(self.path / "index.sqlite3")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS images "
+            "(key TEXT PRIMARY KEY, digest TEXT, created REAL)",
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS prompts "
+            "(prompt TEXT PRIMARY KEY, urls TEXT, created REAL)",
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(prompt: str, url: str) -> str:
+        return hashlib.sha256(json.dumps([prompt, url]).encode()).hexdigest()
+
+    def _file(self, digest: str) -> Path:
+        return self.path / digest[:2] / digest
+
+    def lookup(self, prompt: str, url: str) -> str | None:
+        """
+        Returns the cached file of an image, if there is one
+        """
+        row = self._db.execute(
+            "SELECT digest FROM images WHERE key = ?",
+            (self.key(prompt, url),),
+        ).fetchone()
+        if row is None or not self._file(row[0]).exists():
+            return None
+        return str(self._file(row[0]))
+
+    def _get_session(self) -> httpx.AsyncClient:
+        if self.session is None:
+            self.session = create_session(self.proxy)
+        return self.session
+
+    async def _read(self, url: str) -> bytes | None:
+        async with self.semaphore, self._get_session().stream("GET", url) as response:
+            if response.status_code != 200:
+                return None
+            if int(response.headers.get("content-length", 0)) > self.max_bytes:
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > self.max_bytes:
+                    return None
+            return bytes(data)
+
+    async def _download(
+        self,
+        prompt: str,
+        url: str,
+        metrics: Metrics,
+    ) -> GeneratedImage:
+        path = self.lookup(prompt, url)
+        if path is not None:
+            metrics.inc("image_cache_hits")
+            return GeneratedImage(url, path)
+        try:
+            data = await self._read(url)
+        except httpx.HTTPError:
+            data = None
+        if data is None:
+            # Callers still have the URL to show
+            return GeneratedImage(url)
+        digest = hashlib.sha256(data).hexdigest()
+        file = self._file(digest)
+        if not file.exists():
+            file.parent.mkdir(exist_ok=True)
+            partial = file.with_name(f"{digest}.{uuid.uuid4().hex}.part")
+            partial.write_bytes(data)
+            os.replace(partial, file)
+        self._db.execute(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?)",
+            (self.key(prompt, url), digest, time.time()),
+        )
+        self._db.commit()
+        return GeneratedImage(url, str(file))
+
+    async def fetch(
+        self,
+        prompt: str,
+        urls: Iterable[str],
+        metrics: Metrics | None = None,
+    ) -> list[GeneratedImage]:
+        """
+        Downloads the images drawn for prompt that are not cached yet
+        """
+        metrics = metrics or METRICS
+        return list(
+            await asyncio.gather(
+                *(self._download(prompt, url, metrics) for url in urls),
+            ),
+        )
+
+    async def generate(
+        self,
+        prompt: str,
+        cookies: list[dict],
+        metrics: Metrics | None = None,
+    ) -> list[GeneratedImage]:
+        """
+        Returns the images for prompt, only asking Bing to draw them if they
+        are not all cached
+        """
+        row = self._db.execute(
+            "SELECT urls FROM prompts WHERE prompt = ?",
+            (prompt,),
+        ).fetchone()
+        if row is not None:
+            images = await self.fetch(prompt, json.loads(row[0]), metrics)
+            if all(image.path for image in images):
+                return images
+        async with ImageGenAsync(
+            _cookie_value(cookies, "_U"),
+            quiet=True,
+        ) as image_generator:
+            urls = await image_generator.get_images(prompt)
+        images = await self.fetch(prompt, urls, metrics)
+        self._db.execute(
+            "INSERT OR REPLACE INTO prompts VALUES (?, ?, ?)",
+            (prompt, json.dumps(urls), time.time()),
+        )
+        self._db.commit()
+        return images
+
+    async def close(self) -> None:
+        self._db.close()
+        if self._owns_session and self.session is not None:
+            await self.session.aclose()
+            self.session = None
+
+
+CONTEXT_MARKER = re.compile(r"^\[(system|user|assistant)\]\(#([\w-]+)\)$", re.MULTILINE)
+
+
+class _ContextBlock(NamedTuple):
+    role: str
+    kind: str
+    # Offset of the block in the transcript
+    start: int
+    text: str
+    size: int
+
+
+class ContextWindow:
+    """
+    Keeps a webpage_context transcript under budget bytes. The transcript
+    is split into blocks at its [role](#kind) markers. System blocks are
+    always kept, whole turns are dropped oldest first and search results
+    are only kept for the newest keep_search_results turns, counting the
+    one being asked. The newest turn is kept even if it alone is over
+    budget. When the transcript only grew, just the new part is parsed.
+    """
+
+    def __init__(self, budget: int = 32768, keep_search_results: int = 2) -> None:
+        self.budget: int = budget
+        self.keep_search_results: int = keep_search_results
+        self.transcript: str = ""
+        self.blocks: list[_ContextBlock] = []
+        # Indices of the system blocks, which are always sent
+        self.pinned: list[int] = []
+
+    def _add(self, role: str, kind: str, start: int, end: int | None) -> None:
+        text = self.transcript[start:end]
+        if text:
+            if role == "system":
+                self.pinned.append(len(self.blocks))
+            self.blocks.append(
+                _ContextBlock(role, kind, start, text, len(text.encode())),
+            )
+
+    def _parse(self, start: int) -> None:
+        markers = list(CONTEXT_MARKER.finditer(self.transcript, start))
+        # Text before the first marker is treated as instructions
+        self._add("system", "preamble", start, markers[0].start() if markers else None)
+        for index, marker in enumerate(markers):
+            end = markers[index + 1].start() if index + 1 < len(markers) else None
+            self._add(marker[1], marker[2], marker.start(), end)
+
+    def update(self, transcript: str) -> str:
+        """
+        Takes the full transcript and returns the part that fits the budget
+        """
+        if self.blocks and transcript.startswith(self.transcript):
+            # The last block may have grown, parse again from its marker
+            start = self.blocks.pop().start
+            if self.pinned and self.pinned[-1] == len(self.blocks):
+                self.pinned.pop()
+        else:
+            self.blocks = []
+            self.pinned = []
+            start = 0
+        self.transcript = transcript
+        self._parse(start)
+        return self.render()
+
+    def render(self) -> str:
+        kept = list(self.pinned)
+        used = sum(self.blocks[index].size for index in kept)
+        turn = []
+        turns = 0
+        for index in range(len(self.blocks) - 1, -1, -1):
+            block = self.blocks[index]
+            if block.role == "system":
+                continue
+            if block.kind == "search_results" and turns >= self.keep_search_results:
+                continue
+            turn.append(index)
+            if block.role != "user" and index:
+                continue
+            size = sum(self.blocks[i].size for i in turn)
+            if turns and used + size > self.budget:
+                break
+            kept.extend(turn)
+            used += size
+            turn = []
+            turns += 1
+        return "".join(self.blocks[index].text for index in sorted(kept))
 
 
 class Chatbot:
@@ -581,45 +2518,145 @@ class Chatbot:
         cookies: dict = None,
         proxy: str | None = None,
         cookie_path: str = None,
+        keep_alive: bool = False,
+        session: httpx.AsyncClient | None = None,
+        cache: ResponseCache | None = None,
+        metrics: Metrics | None = None,
+        pool: ConversationPool | None = None,
+        scheduler: AccountScheduler | None = None,
+        prefetch: bool = False,
+        retry: RetryPolicy | None = None,
+        standby: StandbyConnections | None = None,
+        images: ImageCache | None = None,
     ) -> None:
+        """
+        The conversation is created on the first ask, or right away in the
+        background with prefetch=True when an event loop is running
+        """
         if cookies is None:
             cookies = {}
         if cookie_path is not None:
-            try:
-                with open(cookie_path, encoding="utf-8") as f:
-                    self.cookies = json.load(f)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("Cookie file not found") from exc
+            self.cookies = COOKIE_STORE.load(cookie_path)
         else:
             self.cookies = cookies
         self.proxy: str | None = proxy
-        self.chat_hub: _ChatHub = _ChatHub(
-            _Conversation(self.cookies, self.proxy),
-        )
+        self.keep_alive: bool = keep_alive
+        self.pool: ConversationPool | None = pool
+        self.scheduler: AccountScheduler | None = scheduler
+        self.account: _Account | None = None
+        self.cache: ResponseCache | None = cache
+        self.metrics: Metrics = metrics or METRICS
+        self.retry: RetryPolicy = retry or RETRY_POLICY
+        self.standby: StandbyConnections | None = standby
+        self.images: ImageCache | None = images
+        # An owned session is only created once the bot is used
+        self._owns_session: bool = session is None
+        self.session: httpx.AsyncClient | None = session
+        self.chat_hub: _ChatHub | None = None
+        # Exchanges answered from the cache that Bing has not seen; they are
+        # sent as context with the next turn that really asks
+        self._replayed: list[tuple[str, str]] = []
+        self._prefetch: asyncio.Task | None = None
+        if prefetch:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                self._prefetch = loop.create_task(self._create_conversation())
 
     @staticmethod
     async def create(
         cookies: dict = None,
         proxy: str | None = None,
         cookie_path: str = None,
+        keep_alive: bool = False,
+        pool: ConversationPool | None = None,
+        session: httpx.AsyncClient | None = None,
+        scheduler: AccountScheduler | None = None,
+        cache: ResponseCache | None = None,
+        metrics: Metrics | None = None,
+        retry: RetryPolicy | None = None,
+        standby: StandbyConnections | None = None,
+        images: ImageCache | None = None,
     ):
-        self = Chatbot.__new__(Chatbot)
-        if cookies is None:
-            cookies = {}
-        if cookie_path is not None:
-            try:
-                with open(cookie_path, encoding="utf-8") as f:
-                    self.cookies = json.load(f)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("Cookie file not found") from exc
-        else:
-            self.cookies = cookies
-        self.proxy = proxy
-        self.chat_hub = _ChatHub(
-            await _Conversation.create(self.cookies, self.proxy),
+        self = Chatbot(
+            cookies=cookies,
+            proxy=proxy,
+            cookie_path=cookie_path,
+            keep_alive=keep_alive,
+            session=session,
+            cache=cache,
+            metrics=metrics,
+            pool=pool,
+            scheduler=scheduler,
+            retry=retry,
+            standby=standby,
+            images=images,
         )
+        await self._ensure_chat_hub()
         return self
 
+    async def _ensure_chat_hub(self) -> _ChatHub:
+        """
+        Creates the conversation if that has not happened yet
+        """
+        if self.chat_hub is None:
+            if self._prefetch is not None:
+                task, self._prefetch = self._prefetch, None
+                conversation = await task
+            else:
+                conversation = await self._create_conversation()
+            self._set_conversation(conversation)
+        return self.chat_hub
+
+    def _get_session(self) -> httpx.AsyncClient:
+        if self.session is None:
+            self.session = create_session(self.proxy)
+        return self.session
+
+    def _set_conversation(self, conversation: _Conversation) -> None:
+        if self.account is not None:
+            self.scheduler.release(self.account)
+        self.account = conversation.account
+        if self.account is not None:
+            self.cookies = self.account.cookies
+        self.chat_hub = _ChatHub(
+            conversation,
+            keep_alive=self.keep_alive,
+            proxy=self.proxy,
+            session=self._get_session(),
+            metrics=self.metrics,
+            retry=self.retry,
+            standby=self.standby,
+            images=self.images,
+        )
+
+    def _report(self, account: _Account | None, response: dict) -> None:
+        if account is not None:
+            self.scheduler.report(account, response)
+
+    async def _create_conversation(self) -> _Conversation:
+        with self.metrics.timer("conversation_create"):
+            return await self._get_conversation()
+
+    async def _get_conversation(self) -> _Conversation:
+        if self.scheduler is not None:
+            return await self.scheduler.create_conversation(
+                self.proxy,
+                self._get_session(),
+                self.pool,
+                self.retry,
+            )
+        if self.pool is not None:
+            return await self.pool.get(self.cookies, self.proxy)
+        return await _Conversation.create(
+            self.cookies,
+            self.proxy,
+            session=self._get_session(),
+            retry=self.retry,
+        )
+
     async def ask(
         self,
         prompt: str,
@@ -627,23 +2664,32 @@ class Chatbot:
         conversation_style: CONVERSATION_STYLE_TYPE = None,
         options: dict = None,
         webpage_context: str | None = None,
-        search_result: bool = False
+        search_result: bool = False,
+        deadline: float | None = None,
+        first_token_timeout: float | None = None,
+        idle_timeout: float | None = None,
     ) -> dict:
         """
         Ask a question to the bot
         """
-        async for final, response in self.chat_hub.ask_stream(
-            prompt=prompt,
-            conversation_style=conversation_style,
-            wss_link=wss_link,
-            options=options,
-            cookies=self.cookies,
-            webpage_context=webpage_context,
-            search_result=search_result
-        ):
-            if final:
-                return response
-        await self.chat_hub.wss.close()
+        async with _aclosing(
+            self.ask_stream(
+                prompt=prompt,
+                conversation_style=conversation_style,
+                wss_link=wss_link,
+                options=options,
+                webpage_context=webpage_context,
+                search_result=search_result,
+                delta=True,
+                deadline=deadline,
+                first_token_timeout=first_token_timeout,
+                idle_timeout=idle_timeout,
+            ),
+        ) as updates:
+            async for final, response in updates:
+                if final:
+                    return response
+        await self.chat_hub.close()
         return {}
 
     async def ask_stream(
@@ -654,35 +2700,222 @@ class Chatbot:
         raw: bool = False,
         options: dict = None,
         webpage_context: str | None = None,
-        search_result: bool = False
+        search_result: bool = False,
+        delta: bool = False,
+        buffer: int = 0,
+        overflow: OVERFLOW_POLICY_TYPE = "coalesce",
+        deadline: float | None = None,
+        first_token_timeout: float | None = None,
+        idle_timeout: float | None = None,
     ) -> Generator[str, None, None]:
         """
-        Ask a question to the bot
+        Ask a question to the bot. With delta=True, updates are StreamDelta
+        objects holding only the new text instead of the full response.
+        Cached answers to first turns are replayed as a single update.
+        See _ChatHub.ask_stream for buffer, overflow and the timeouts.
         """
-        async for response in self.chat_hub.ask_stream(
-            prompt=prompt,
-            conversation_style=conversation_style,
-            wss_link=wss_link,
-            raw=raw,
-            options=options,
-            cookies=self.cookies,
-            webpage_context=webpage_context,
-            search_result=search_result
+        cache_key = None
+        if (
+            self.cache is not None
+            and not raw
+            and not self._replayed
+            and (self.chat_hub is None or self.chat_hub.request.invocation_id == 0)
         ):
-            yield response
+            cache_key = ResponseCache.key(
+                prompt,
+                conversation_style,
+                options,
+                webpage_context,
+                search_result,
+            )
+            response = self.cache.get(cache_key)
+            if response is not None:
+                self.metrics.inc("cache_hits")
+                text = _response_text(response)
+                # Follow-ups must not be treated as first turns again
+                self._replayed.append((prompt, text))
+                yield False, StreamDelta(text, 0) if delta else text
+                yield True, response
+                return
+        await self._ensure_chat_hub()
+        if self._replayed and self.chat_hub.request.invocation_id == 0:
+            webpage_context = self._replayed_context(webpage_context)
+        # Closed as soon as the caller stops, not when it is garbage collected
+        async with _aclosing(
+            self.chat_hub.ask_stream(
+                prompt=prompt,
+                conversation_style=conversation_style,
+                wss_link=wss_link,
+                raw=raw,
+                options=options,
+                cookies=self.cookies,
+                webpage_context=webpage_context,
+                search_result=search_result,
+                delta=delta,
+                buffer=buffer,
+                overflow=overflow,
+                deadline=deadline,
+                first_token_timeout=first_token_timeout,
+                idle_timeout=idle_timeout,
+            ),
+        ) as updates:
+            async for final, response in updates:
+                if final:
+                    self._replayed.clear()
+                    self._report(self.account, response)
+                    if cache_key is not None and _is_cacheable(response):
+                        self.cache.set(cache_key, response)
+                yield final, response
+
+    def _replayed_context(self, webpage_context: str | None) -> str:
+        """
+        Prepends the cached exchanges to webpage_context as a transcript
+        """
+        transcript = "\n\n".join(
+            f"[user](#message)\n{prompt}\n\n[assistant](#message)\n{text}"
+            for prompt, text in self._replayed
+        )
+        if webpage_context:
+            return f"{transcript}\n\n{webpage_context}"
+        return transcript
+
+    async def ask_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 4,
+        ordered: bool = False,
+        wss_link: str = "wss://sydney.bing.com/sydney/ChatHub",
+        conversation_style: CONVERSATION_STYLE_TYPE = None,
+        options: dict = None,
+        webpage_context: str | None = None,
+        search_result: bool = False,
+        deadline: float | None = None,
+        first_token_timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ) -> AsyncGenerator[BatchResult, None]:
+        """
+        Ask many prompts, each in its own conversation, with at most
+        concurrency of them in flight. Results are yielded as they complete,
+        or in input order with ordered=True. A failing prompt is reported
+        through BatchResult.error without stopping the batch.
+        """
+
+        async def run(index: int, prompt: str) -> BatchResult:
+            chat_hub = None
+            account = None
+            try:
+                conversation = await self._create_conversation()
+                account = conversation.account
+                chat_hub = _ChatHub(
+                    conversation,
+                    proxy=self.proxy,
+                    session=self._get_session(),
+                    metrics=self.metrics,
+                    retry=self.retry,
+                    standby=self.standby,
+                    images=self.images,
+                )
+                async with _aclosing(
+                    chat_hub.ask_stream(
+                        prompt=prompt,
+                        conversation_style=conversation_style,
+                        wss_link=wss_link,
+                        options=options,
+                        cookies=account.cookies if account else self.cookies,
+                        webpage_context=webpage_context,
+                        search_result=search_result,
+                        deadline=deadline,
+                        first_token_timeout=first_token_timeout,
+                        idle_timeout=idle_timeout,
+                    ),
+                ) as updates:
+                    async for final, response in updates:
+                        if final:
+                            self._report(account, response)
+                            return BatchResult(index, prompt, response)
+                return BatchResult(index, prompt, {})
+            except Exception as exc:
+                return BatchResult(index, prompt, None, exc)
+            finally:
+                if chat_hub is not None:
+                    await chat_hub.close()
+                if account is not None:
+                    self.scheduler.release(account)
+
+        # Workers pull prompts as they go, so a long iterable is never
+        # read ahead or turned into one waiting task per prompt
+        numbered = iter(enumerate(prompts))
+        results: asyncio.Queue[BatchResult | None] = asyncio.Queue()
+
+        async def worker() -> None:
+            try:
+                for index, prompt in numbered:
+                    results.put_nowait(await run(index, prompt))
+            finally:
+                results.put_nowait(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        # Results that finished ahead of an earlier prompt, with ordered=True
+        early: dict[int, BatchResult] = {}
+        next_index = 0
+        running = len(workers)
+        try:
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                    continue
+                if not ordered:
+                    yield result
+                    continue
+                early[result.index] = result
+                while next_index in early:
+                    yield early.pop(next_index)
+                    next_index += 1
+            for task in workers:
+                # The prompts iterable itself failed
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in workers:
+                task.cancel()
 
     async def close(self) -> None:
         """
         Close the connection
         """
-        await self.chat_hub.close()
+        await self._cancel_prefetch()
+        if self.chat_hub is not None:
+            await self.chat_hub.close()
+        if self.account is not None:
+            self.scheduler.release(self.account)
+            self.account = None
+        if self._owns_session and self.session is not None:
+            await self.session.aclose()
+            self.session = None
+
+    async def _cancel_prefetch(self) -> None:
+        """
+        Stops a background conversation create and releases the account of
+        a conversation it already made
+        """
+        if self._prefetch is None:
+            return
+        self._prefetch.cancel()
+        conversation = (await asyncio.gather(self._prefetch, return_exceptions=True))[0]
+        self._prefetch = None
+        if isinstance(conversation, _Conversation) and conversation.account:
+            self.scheduler.release(conversation.account)
 
     async def reset(self) -> None:
         """
         Reset the conversation
         """
-        await self.close()
-        self.chat_hub = _ChatHub(await _Conversation.create(self.cookies))
+        if self.chat_hub is not None:
+            await self.chat_hub.close()
+        await self._cancel_prefetch()
+        self._replayed.clear()
+        self._set_conversation(await self._create_conversation())
 
 
 async def _get_input_async(
@@ -723,6 +2956,125 @@ def _create_completer(commands: list, pattern_str: str = "$"):
     return WordCompleter(words=commands, pattern=re.compile(pattern_str))
 
 
+MARKDOWN_FENCE = re.compile(r"^ {0,3}(```|~~~)")
+MARKDOWN_REFERENCE = re.compile(r"^ {0,3}\[[^\]]+\]:\s*\S+.*$", re.MULTILINE)
+
+
+def _stable_markdown_end(text: str, start: int = 0) -> int:
+    """
+    Returns the end of the last finished block after start, that is the
+    last blank line outside a code fence
+    """
+    end = start
+    position = start
+    fenced = False
+    for line in text[start:].splitlines(keepends=True):
+        position += len(line)
+        if MARKDOWN_FENCE.match(line):
+            fenced = not fenced
+        elif not fenced and not line.strip() and line.endswith("\n"):
+            end = position
+    return end
+
+
+class _MarkdownStream:
+    """
+    Renders a growing Markdown answer in a rich Live display. Finished
+    blocks are printed above the display once; only the trailing block is
+    parsed again, at most fps times per second.
+    """
+
+    def __init__(self, live: Live, fps: float = 15) -> None:
+        self.live: Live = live
+        self.interval: float = 1 / fps
+        self.text: str = ""
+        # Length of the text already printed as finished blocks
+        self.committed: int = 0
+        # Link definitions of printed blocks, needed to resolve [^1^][1]
+        self.references: list[str] = []
+        self.last_render: float = 0.0
+        self.pending: asyncio.TimerHandle | None = None
+
+    def _markdown(self, text: str) -> Markdown:
+        if self.references:
+            text = text + "\n\n" + "\n".join(self.references)
+        return Markdown(text)
+
+    def update(self, text: str) -> None:
+        if len(text) < len(self.text) or not text.startswith(
+            self.text[: self.committed],
+        ):
+            self.live.console.print(Markdown("***Bing revoked the response.***"))
+            self.committed = 0
+            self.references = []
+        self.text = text
+        wait = self.last_render + self.interval - time.monotonic()
+        if wait <= 0:
+            self.render()
+        elif self.pending is None:
+            self.pending = asyncio.get_running_loop().call_later(wait, self.render)
+
+    def render(self, final: bool = False) -> None:
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        end = len(self.text) if final else _stable_markdown_end(
+            self.text,
+            self.committed,
+        )
+        if end > self.committed:
+            block = self.text[self.committed : end]
+            self.live.console.print(self._markdown(block))
+            self.references.extend(MARKDOWN_REFERENCE.findall(block))
+            self.committed = end
+        self.live.update(self._markdown(self.text[self.committed :]), refresh=True)
+        self.last_render = time.monotonic()
+
+
+class _StreamWriter:
+    """
+    Collects streamed chunks and writes them out every interval seconds or
+    once max_size characters are pending. Pipes get larger, rarer writes.
+    """
+
+    def __init__(
+        self,
+        stream=None,
+        interval: float | None = None,
+        max_size: int | None = None,
+    ) -> None:
+        self.stream = stream or sys.stdout
+        tty = self.stream.isatty()
+        self.interval: float = interval if interval is not None else 0.05 if tty else 1
+        self.max_size: int = max_size or (4096 if tty else 65536)
+        self.chunks: list[str] = []
+        self.size: int = 0
+        self.last_flush: float = time.monotonic()
+        self.pending: asyncio.TimerHandle | None = None
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self.chunks.append(text)
+        self.size += len(text)
+        wait = self.last_flush + self.interval - time.monotonic()
+        if self.size >= self.max_size or wait <= 0:
+            self.flush()
+        elif self.pending is None:
+            self.pending = asyncio.get_running_loop().call_later(wait, self.flush)
+
+    def flush(self) -> None:
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        if self.chunks:
+            self.stream.write("".join(self.chunks))
+            self.stream.flush()
+            self.chunks.clear()
+            self.size = 0
+        self.last_flush = time.monotonic()
+
+
 async def async_main(args: argparse.Namespace) -> None:
     """
     Main function
@@ -773,35 +3125,34 @@ async def async_main(args: argparse.Namespace) -> None:
                 )["item"]["messages"][1]["adaptiveCards"][0]["body"][0]["text"],
             )
         else:
-            wrote = 0
             if args.rich:
-                md = Markdown("")
-                with Live(md, auto_refresh=False) as live:
+                with Live(Markdown(""), auto_refresh=False) as live:
+                    stream = _MarkdownStream(live, args.fps)
+                    # Rendering is slow, only the newest text is worth drawing
                     async for final, response in bot.ask_stream(
                         prompt=question,
                         conversation_style=args.style,
                         wss_link=args.wss_link,
+                        buffer=1,
+                        overflow="latest",
                     ):
                         if not final:
-                            if wrote > len(response):
-                                print(md)
-                                print(Markdown("***Bing revoked the response.***"))
-                            wrote = len(response)
-                            md = Markdown(response)
-                            live.update(md, refresh=True)
+                            stream.update(response)
+                    stream.render(final=True)
             else:
+                writer = _StreamWriter(interval=args.flush_interval)
                 async for final, response in bot.ask_stream(
                     prompt=question,
                     conversation_style=args.style,
                     wss_link=args.wss_link,
+                    delta=True,
                 ):
                     if not final:
-                        if not wrote:
-                            print(response, end="", flush=True)
-                        else:
-                            print(response[wrote:], end="", flush=True)
-                        wrote = len(response)
-                print()
+                        if response.revoked:
+                            writer.write("\n***Bing revoked the response.***\n")
+                        writer.write(response.text)
+                writer.write("\n")
+                writer.flush()
     await bot.close()
 
 
@@ -821,6 +3172,18 @@ def main() -> None:
     parser.add_argument("--enter-once", action="store_true")
     parser.add_argument("--no-stream", action="store_true")
     parser.add_argument("--rich", action="store_true")
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=15,
+        help="Maximum redraws per second with --rich",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=None,
+        help="Seconds between output flushes while streaming (default 0.05, or 1 if stdout is not a terminal)",
+    )
     parser.add_argument(
         "--proxy",
         help="Proxy URL (e.g. socks5://127.0.0.1:1080)",
@@ -859,8 +3222,8 @@ def main() -> None:
             "ERROR: use --cookie-file or set the COOKIE_FILE environment variable",
         )
     try:
-        args.cookies = json.loads(Path(args.cookie_file).read_text(encoding="utf-8"))
-    except OSError as exc:
+        args.cookies = COOKIE_STORE.load(args.cookie_file)
+    except (OSError, ValueError) as exc:
         print(f"Could not open cookie file: {exc}", file=sys.stderr)
         sys.exit(1)
 
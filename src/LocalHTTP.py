@@ -0,0 +1,90 @@
+"""
+Minimal HTTP/1.1 request parsing and responses shared by the local
+asyncio servers, MockServer and ChatServer.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import NamedTuple
+
+STATUS_TEXT = {
+    101: "Switching Protocols",
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class BadRequest(Exception):
+    """
+    The client sent something that is not a valid HTTP request. The
+    connection cannot be used for further requests.
+    """
+
+
+class Request(NamedTuple):
+    method: str
+    target: str
+    # Target without the query string
+    path: str
+    # Header names are lower case
+    headers: dict
+    body: bytes
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    """
+    Reads one request, or returns None once the client has gone away
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError as exc:
+        raise BadRequest("Request head is too large") from exc
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    parts = request_line.split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise BadRequest(f"Malformed request line {request_line[:100]!r}")
+    method, target, _ = parts
+    headers = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    body = b""
+    if "content-length" in headers:
+        length = headers["content-length"]
+        if not length.isdigit():
+            raise BadRequest(f"Invalid Content-Length {length[:20]!r}")
+        try:
+            body = await reader.readexactly(int(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+    return Request(method, target, target.split("?", 1)[0], headers, body)
+
+
+def write_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    data: bytes,
+    content_type: str = "application/json",
+    headers: dict | None = None,
+) -> None:
+    """
+    Writes a response with a known length; the caller drains the writer
+    """
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"{extra}"
+        "\r\n".encode()
+        + data,
+    )
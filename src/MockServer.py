@@ -0,0 +1,497 @@
+"""
+Local stand-in for the Bing conversation and ChatHub endpoints, used to
+benchmark EdgeGPT without network access.
+
+    python -m MockServer --port 8080
+    BING_PROXY_URL=http://127.0.0.1:8080/turing/conversation/create \
+        edge-gpt --cookie-file cookies.json --wss-link ws://127.0.0.1:8080/sydney/ChatHub
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import uuid
+
+from LocalHTTP import BadRequest
+from LocalHTTP import read_request
+from LocalHTTP import write_response
+
+DELIMITER = "\x1e"
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim "
+    "veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea "
+    "commodo consequat."
+).split(" ")
+
+
+def _append_identifier(msg: dict) -> bytes:
+    return (json.dumps(msg, ensure_ascii=False) + DELIMITER).encode()
+
+
+def _encode_frame(opcode: int, payload: bytes) -> bytes:
+    """
+    Encodes an unmasked server websocket frame
+    """
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x80 | opcode, length])
+    elif length < 1 << 16:
+        header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, "big")
+    return header + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    """
+    Reads one client websocket frame
+    """
+    head = await reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b""
+    payload = await reader.readexactly(length)
+    if mask and length:
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (
+            int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")
+        ).to_bytes(length, "big")
+    return fin, opcode, payload
+
+
+class _WebSocket:
+    """
+    Minimal server side websocket over asyncio streams
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def recv(self) -> str | None:
+        """
+        Returns the next text message, or None once the client closed
+        """
+        message = b""
+        while True:
+            try:
+                fin, opcode, payload = await _read_frame(self.reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return None
+            if opcode == 0x8:
+                await self._write(_encode_frame(0x8, payload[:2]))
+                return None
+            if opcode == 0x9:
+                await self._write(_encode_frame(0xA, payload))
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if fin:
+                try:
+                    return message.decode()
+                except UnicodeDecodeError:
+                    await self.close(1007, "Invalid UTF-8")
+                    return None
+
+    async def send(self, data: bytes) -> None:
+        await self._write(_encode_frame(0x1, data))
+
+    async def close(self, code: int, reason: str) -> None:
+        """
+        Sends a close frame, the caller then drops the connection
+        """
+        await self._write(_encode_frame(0x8, code.to_bytes(2, "big") + reason.encode()))
+
+    async def _write(self, data: bytes) -> None:
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class MockChatHub:
+    """
+    Implements conversation/create, UpdateConversation and the ChatHub
+    websocket protocol with configurable speed and failures
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        token_rate: float = 50,
+        tokens: int = 200,
+        latency: float = 0.0,
+        first_token_latency: float = 0.0,
+        failure_rate: float = 0.0,
+        apology_rate: float = 0.0,
+        max_messages: int = 20,
+        throttle_after: int | None = None,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        # Tokens streamed per second, 0 sends them as fast as possible
+        self.token_rate: float = token_rate
+        self.tokens: int = tokens
+        # Added to every REST response and to the handshake
+        self.latency: float = latency
+        self.first_token_latency: float = first_token_latency
+        # Chance of failing a REST call or dropping a stream halfway
+        self.failure_rate: float = failure_rate
+        # Chance of Bing revoking an answer while it is streamed
+        self.apology_rate: float = apology_rate
+        self.max_messages: int = max_messages
+        # Total turns after which every answer is reported as throttled
+        self.throttle_after: int | None = throttle_after
+        self.turns: int = 0
+        self.conversations: dict[str, int] = {}
+        self.server: asyncio.AbstractServer | None = None
+
+    @property
+    def conversation_url(self) -> str:
+        return f"http://{self.host}:{self.port}/turing/conversation/create"
+
+    @property
+    def wss_link(self) -> str:
+        return f"ws://{self.host}:{self.port}/sydney/ChatHub"
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+        )
+        if not self.port:
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __aenter__(self) -> MockChatHub:
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as exc:
+                    data = json.dumps({"error": str(exc)}).encode()
+                    write_response(writer, 400, data)
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                method, path, headers = request.method, request.path, request.headers
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._upgrade(reader, writer, headers)
+                    return
+                if method == "GET" and path.endswith("/conversation/create"):
+                    status, payload = await self._create_conversation()
+                elif method == "POST" and path.rstrip("/").endswith(
+                    "/UpdateConversation",
+                ):
+                    status, payload = await self._update_conversation(request.body)
+                else:
+                    status, payload = 404, {"error": "Not found"}
+                write_response(writer, status, json.dumps(payload).encode())
+                await writer.drain()
+        except ConnectionError:
+            # Clients drop the socket when they give up on a turn
+            pass
+        finally:
+            writer.close()
+
+    def _failed(self) -> bool:
+        return random.random() < self.failure_rate
+
+    async def _create_conversation(self) -> tuple[int, dict]:
+        await asyncio.sleep(self.latency)
+        if self._failed():
+            return 503, {"error": "Injected failure"}
+        conversation_id = f"51D|BingProd|{uuid.uuid4().hex.upper()}"
+        self.conversations[conversation_id] = 0
+        return 200, {
+            "conversationId": conversation_id,
+            "clientId": str(random.randint(10**15, 10**16 - 1)),
+            "conversationSignature": base64.b64encode(
+                uuid.uuid4().bytes * 2,
+            ).decode(),
+            "result": {"value": "Success", "message": None},
+        }
+
+    async def _update_conversation(self, body: bytes) -> tuple[int, dict]:
+        await asyncio.sleep(self.latency)
+        if self._failed():
+            return 503, {"error": "Injected failure"}
+        try:
+            json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "Request body is not valid JSON"}
+        return 200, {"result": {"value": "Success", "message": None}}
+
+    async def _upgrade(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: dict,
+    ) -> None:
+        accept = base64.b64encode(
+            hashlib.sha1(
+                (headers["sec-websocket-key"] + WEBSOCKET_GUID).encode(),
+            ).digest(),
+        ).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n"
+            "\r\n".encode(),
+        )
+        await writer.drain()
+        websocket = _WebSocket(reader, writer)
+        handshaken = False
+        while True:
+            message = await websocket.recv()
+            if message is None:
+                return
+            for record in message.split(DELIMITER):
+                if not record:
+                    continue
+                try:
+                    request = json.loads(record)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    await websocket.close(1007, "Invalid JSON record")
+                    return
+                if not handshaken:
+                    await asyncio.sleep(self.latency)
+                    await websocket.send(_append_identifier({}))
+                    handshaken = True
+                elif request.get("type") == 4:
+                    if not await self._answer(websocket, request):
+                        return
+                elif request.get("type") == 6:
+                    await websocket.send(_append_identifier({"type": 6}))
+
+    async def _answer(self, websocket: _WebSocket, request: dict) -> bool:
+        """
+        Streams the answer to one invocation, returns False if the
+        connection was dropped on purpose
+        """
+        try:
+            arguments = request["arguments"][0]
+            invocation_id = request["invocationId"]
+            conversation_id = arguments["conversationId"]
+            prompt = arguments["message"]["text"]
+        except (KeyError, IndexError, TypeError):
+            await websocket.close(1007, "Malformed invocation")
+            return False
+        count = self.conversations.get(conversation_id, 0) + 1
+        self.conversations[conversation_id] = count
+        self.turns += 1
+        throttled = (
+            self.throttle_after is not None and self.turns > self.throttle_after
+        )
+        message_id = str(uuid.uuid4())
+        words = [f"Mock answer to: {prompt}\n\n"] + [
+            LOREM[index % len(LOREM)] + " " for index in range(self.tokens)
+        ]
+        revoke_at = (
+            random.randint(1, len(words))
+            if random.random() < self.apology_rate
+            else None
+        )
+        drop_at = random.randint(1, len(words)) if self._failed() else None
+        await asyncio.sleep(self.first_token_latency)
+        text = ""
+        apology = False
+        for index, word in enumerate(words, 1):
+            if drop_at == index:
+                websocket.writer.transport.abort()
+                return False
+            if revoke_at == index:
+                apology = True
+                await websocket.send(
+                    _append_identifier(
+                        self._update(
+                            message_id,
+                            "Sorry! That's on me, I can't give a response to that right now.",
+                            "Apology",
+                        ),
+                    ),
+                )
+                break
+            text += word
+            await websocket.send(
+                _append_identifier(self._update(message_id, text, "DeepLeo")),
+            )
+            if self.token_rate:
+                await asyncio.sleep(1 / self.token_rate)
+        bot_message = self._message(
+            message_id,
+            "Sorry! That's on me, I can't give a response to that right now."
+            if apology
+            else text,
+            "Apology" if apology else "DeepLeo",
+        )
+        final = {
+            "type": 2,
+            "invocationId": invocation_id,
+            "item": {
+                "messages": [
+                    {
+                        "text": prompt,
+                        "author": "user",
+                        "messageId": str(uuid.uuid4()),
+                        "messageType": "Chat",
+                    },
+                    bot_message,
+                ],
+                "firstNewMessageIndex": 1,
+                "conversationId": conversation_id,
+                "requestId": str(uuid.uuid4()),
+                "throttling": {
+                    "maxNumUserMessagesInConversation": self.max_messages,
+                    "numUserMessagesInConversation": count,
+                },
+                "result": {
+                    "value": "Throttled" if throttled else "Success",
+                    "message": text,
+                    "serviceVersion": "mock",
+                },
+            },
+        }
+        await websocket.send(
+            _append_identifier(final)
+            + _append_identifier({"type": 3, "invocationId": invocation_id}),
+        )
+        return True
+
+    @staticmethod
+    def _message(message_id: str, text: str, content_origin: str) -> dict:
+        return {
+            "text": text,
+            "author": "bot",
+            "messageId": message_id,
+            "contentOrigin": content_origin,
+            "adaptiveCards": [
+                {
+                    "type": "AdaptiveCard",
+                    "version": "1.0",
+                    "body": [{"type": "TextBlock", "text": text, "wrap": True}],
+                },
+            ],
+        }
+
+    def _update(self, message_id: str, text: str, content_origin: str) -> dict:
+        return {
+            "type": 1,
+            "target": "update",
+            "arguments": [
+                {
+                    "messages": [self._message(message_id, text, content_origin)],
+                    "requestId": message_id,
+                },
+            ],
+        }
+
+
+async def async_main(args: argparse.Namespace) -> None:
+    server = MockChatHub(
+        host=args.host,
+        port=args.port,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        latency=args.latency,
+        first_token_latency=args.first_token_latency,
+        failure_rate=args.failure_rate,
+        apology_rate=args.apology_rate,
+        max_messages=args.max_messages,
+        throttle_after=args.throttle_after,
+    )
+    async with server:
+        print(f"BING_PROXY_URL={server.conversation_url}")
+        print(f"--wss-link {server.wss_link}")
+        await server.server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--token-rate",
+        type=float,
+        default=50,
+        help="Tokens per second, 0 for no delay",
+    )
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per answer")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to REST calls and the websocket handshake",
+    )
+    parser.add_argument(
+        "--first-token-latency",
+        type=float,
+        default=0.0,
+        help="Seconds before the first token of an answer",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Chance of a failed REST call or a dropped stream",
+    )
+    parser.add_argument(
+        "--apology-rate",
+        type=float,
+        default=0.0,
+        help="Chance of an answer being revoked while streamed",
+    )
+    parser.add_argument("--max-messages", type=int, default=20)
+    parser.add_argument(
+        "--throttle-after",
+        type=int,
+        default=None,
+        help="Report every answer after this many turns as throttled",
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(async_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()